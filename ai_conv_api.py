@@ -1,20 +1,65 @@
 
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI, BackgroundTasks
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from functools import lru_cache
+import asyncio
+import bisect
+import gzip
+import hashlib
+import json
+import mmap
+import random
+import re
+import sqlite3
+import struct
+import sys
+import threading
 import time
 import uuid
 import os
-from typing import List, Literal
+from typing import Awaitable, Callable, List, Optional, Tuple
+from email.utils import parsedate_to_datetime
+import httpx
 import openai
 import google.generativeai as genai
-from openai import OpenAI as DeepSeekClient
+from google.api_core import exceptions as google_exceptions
+from openai import AsyncOpenAI
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 support in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
 
 # ==== CONFIGURATION ====
 openai_api_key = os.environ.get("OPENAI_API_KEY")
 if not openai_api_key:
     raise ValueError("OPENAI_API_KEY environment variable not set.")
-openai.api_key = openai_api_key
 
 gemini_api_key = os.environ.get("GEMINI_API_KEY")
 if not gemini_api_key:
@@ -24,16 +69,95 @@ genai.configure(api_key=gemini_api_key)
 deepseek_api_key = os.environ.get("DEEPSEEK_API_KEY")
 if not deepseek_api_key:
     raise ValueError("DEEPSEEK_API_KEY environment variable not set.")
-deepseek_client = DeepSeekClient(api_key=deepseek_api_key, base_url="https://api.deepseek.com")
+deepseek_base_url = "https://api.deepseek.com"
 
 #gemini_model_name = "gemini-1.5-pro-latest"
 gemini_model_name = "gemini-2.0-flash"
 
 MAX_TURNS = 9
+MAX_TURNS_LIMIT = int(os.environ.get("MAX_TURNS_LIMIT", "50"))
 MAX_TOKENS_PER_MODEL = 256
 CONVO_TIMEOUT_SECONDS = 120
+# Longest a /convo-log long-poll (the ``wait`` parameter) may be held open.
+CONVO_LOG_MAX_WAIT_SECONDS = float(os.environ.get("CONVO_LOG_MAX_WAIT_SECONDS", "30"))
+# How long clients and shared caches may keep the log of a conversation that has ended.
+ENDED_CONVO_MAX_AGE_SECONDS = int(os.environ.get("ENDED_CONVO_MAX_AGE_SECONDS", str(365 * 24 * 3600)))
+
+# ==== HTTP TRANSPORT ====
+# One pooled httpx client is shared by every OpenAI-compatible provider so TLS sessions and
+# keep-alive connections are reused across turns and conversations.
+HTTP2_ENABLED = os.environ.get("HTTP2_ENABLED", "1") == "1" and HTTP2_AVAILABLE
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", "200"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("HTTP_MAX_KEEPALIVE_CONNECTIONS", "50"))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY_SECONDS", "30"))
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.environ.get("HTTP_CONNECT_TIMEOUT_SECONDS", "5"))
+HTTP_READ_TIMEOUT_SECONDS = float(os.environ.get("HTTP_READ_TIMEOUT_SECONDS", "60"))
+HTTP_POOL_TIMEOUT_SECONDS = float(os.environ.get("HTTP_POOL_TIMEOUT_SECONDS", "10"))
+
+# Created once in the app lifespan hook.
+http_client: Optional[httpx.AsyncClient] = None
+
+def build_http_client() -> httpx.AsyncClient:
+    """
+    Builds the shared HTTP transport used by the OpenAI and DeepSeek clients. httpx keeps a
+    separate keep-alive pool per host inside a single client, and negotiates HTTP/2 when the
+    optional ``h2`` package is installed and ``HTTP2_ENABLED`` is set.
 
-app = FastAPI()
+    :return: A configured, pooled asynchronous HTTP client.
+    :rtype: httpx.AsyncClient
+    """
+    return httpx.AsyncClient(
+        http2=HTTP2_ENABLED,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        timeout=httpx.Timeout(
+            connect=HTTP_CONNECT_TIMEOUT_SECONDS,
+            read=HTTP_READ_TIMEOUT_SECONDS,
+            write=HTTP_READ_TIMEOUT_SECONDS,
+            pool=HTTP_POOL_TIMEOUT_SECONDS,
+        ),
+    )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Creates the shared HTTP transport and provider clients when the app starts. On shutdown,
+    running conversations are cancelled (and recorded as such) before the journal, connection
+    pool and database are closed.
+
+    :param app: The FastAPI application.
+    :type app: FastAPI
+    """
+    global http_client
+    http_client = build_http_client()
+    for provider in providers.values():
+        if provider.kind == "openai":
+            # SDK-level retries are disabled; with_retries applies one policy to every provider.
+            provider.client = AsyncOpenAI(
+                api_key=provider.api_key, base_url=provider.base_url, http_client=http_client, max_retries=0
+            )
+    print(f"HTTP transport ready (HTTP/2: {HTTP2_ENABLED}, max connections: {HTTP_MAX_CONNECTIONS}).")
+    if convo_db is not None:
+        await convo_db.open()
+        print(f"Conversation database ready at {CONVO_DB_PATH}.")
+    if journal is not None:
+        journal.start()
+    sweeper = asyncio.create_task(conversations.sweep())
+    try:
+        yield
+    finally:
+        sweeper.cancel()
+        await asyncio.gather(*(stop_conversation(convo_id) for convo_id in list(conversation_tasks)))
+        if journal is not None:
+            await journal.stop()
+        await http_client.aclose()
+        if convo_db is not None:
+            await convo_db.close()
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # or specify ["http://your-react-domain.com"]
@@ -44,257 +168,2698 @@ app.add_middleware(
 
 class StartConversationRequest(BaseModel):
     topic: str
+    # Ordered provider names to cycle through; "auto" picks the provider with the most spare capacity.
+    rotation: Optional[List[str]] = None
+    turns: int = Field(default=MAX_TURNS, ge=1, le=MAX_TURNS_LIMIT)
 
 class Message(BaseModel):
-    sender: Literal['GPT', 'Gemini', 'DeepSeek']
+    sender: str
     content: str
+    # True while the turn is still streaming in.
+    in_progress: bool = False
 
 class ConversationLog(BaseModel):
     convo_id: str
     topic: str
     messages: List[Message]
+    status: Optional[str] = None
+
+def dump_json(obj) -> bytes:
+    """
+    Encodes a value as compact UTF-8 JSON, with orjson when it is installed.
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def json_string_body(text: str) -> bytes:
+    """
+    Encodes a string as a JSON string literal without the surrounding quotes. Escaping is per
+    character, so the body of ``a + b`` is the body of ``a`` followed by the body of ``b``.
+    """
+    return dump_json(text)[1:-1]
+
+class MessageRecord:
+    """
+    A stored message. Conversations keep these rather than dicts or ``Message`` models: slots
+    keep each record small, the sender name is interned so every message from a provider shares
+    one string, and nothing is validated per turn. Responses use the ``Message`` shape via ``to_dict``.
+    """
+
+    __slots__ = ("sender", "content", "in_progress", "started_at", "completed_at", "tokens", "json")
+
+    def __init__(self, sender: str, content: str, in_progress: bool = False,
+                 started_at: Optional[float] = None, completed_at: Optional[float] = None,
+                 tokens: Optional[int] = None):
+        self.sender = sys.intern(sender)
+        self.content = content
+        self.in_progress = in_progress
+        self.started_at = started_at
+        self.completed_at = completed_at
+        # Approximate completion tokens (about four characters each), set when the turn completes.
+        self.tokens = tokens
+        # Encoded API form of the completed message, including its index; see ``encoded``.
+        self.json = None
+
+    def complete(self, content: str):
+        """
+        Stores the final text of the turn and stamps its completion.
+        """
+        self.content = content
+        self.in_progress = False
+        self.completed_at = time.time()
+        self.tokens = len(content) // 4
+
+    def to_dict(self) -> dict:
+        # Same shape as ``Message``, for the API responses.
+        return {"sender": self.sender, "content": self.content, "in_progress": self.in_progress}
+
+    def encoded(self, index: int) -> bytes:
+        """
+        Returns the message as JSON bytes with its index. Completed messages never change, so
+        they are encoded once and the bytes are reused by every later response.
+        """
+        if self.json is not None:
+            return self.json
+        encoded = dump_json(dict(self.to_dict(), index=index))
+        if not self.in_progress:
+            self.json = encoded
+        return encoded
+
+# Conversation lifecycle. A conversation is queued until its task starts, then running until it
+# ends in one of the terminal states, after which its log never changes.
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_FINISHED = "finished"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+TERMINAL_STATUSES = (STATUS_FINISHED, STATUS_FAILED, STATUS_CANCELLED)
+
+# Running conversation tasks by convo_id: strong references so they are not garbage collected
+# mid-flight, and the handle used to cancel them.
+conversation_tasks = {}
+
+# ==== LIVE EVENTS ====
+SSE_KEEPALIVE_SECONDS = float(os.environ.get("SSE_KEEPALIVE_SECONDS", "15"))
+# Events kept per conversation for late or resuming subscribers.
+EVENT_BUFFER_SIZE = int(os.environ.get("EVENT_BUFFER_SIZE", "1024"))
+# Rough per-event bookkeeping cost (tuple, event name, list slots) added to the payload size.
+EVENT_OVERHEAD_BYTES = 100
+WS_SEND_BUFFER = int(os.environ.get("WS_SEND_BUFFER", "256"))
+WS_MAX_SUBSCRIPTIONS = int(os.environ.get("WS_MAX_SUBSCRIPTIONS", "100"))
+# What to do when a WebSocket client's send buffer is full: "drop" skips streamed token deltas
+# for that client, "disconnect" closes the connection.
+WS_SLOW_CONSUMER_POLICY = os.environ.get("WS_SLOW_CONSUMER_POLICY", "drop")
+
+class EventChannel:
+    """
+    The live event stream of one conversation (turn-started, token-delta, turn-completed,
+    turn-skipped, conversation-finished), held in a fixed-size ring buffer shared by every
+    subscriber. Events are numbered from 1 so a client can resume after the last id it saw.
+    Each event is JSON-encoded once when published; subscribers only keep a cursor.
+
+    When the conversation ends the ring is replaced by just its turn events: every streamed
+    token delta is repeated in full by its ``turn-completed``, so replaying a finished
+    conversation does not need them. ``nbytes`` is then the size of what is kept.
+    """
+
+    def __init__(self, size: int = None):
+        self.size = size or EVENT_BUFFER_SIZE
+        self._ring = [None] * self.size
+        self._kept = None
+        self._kept_seqs = None
+        self.last_seq = 0
+        self.nbytes = 0
+        self.closed = False
+        self._changed = asyncio.Event()
+
+    @property
+    def first_seq(self) -> int:
+        """The oldest sequence number still held in the buffer."""
+        return max(1, self.last_seq - self.size + 1)
+
+    def publish(self, event: str, data: dict) -> int:
+        """
+        Appends an event, overwriting the oldest one if the buffer is full, and wakes every
+        waiting subscriber.
+
+        :param event: The event type.
+        :type event: str
+        :param data: The JSON-serializable event payload.
+        :type data: dict
+        :return: The sequence number of the new event.
+        :rtype: int
+        """
+        self.last_seq += 1
+        self._ring[self.last_seq % self.size] = (self.last_seq, event, json.dumps(data))
+        self._notify()
+        return self.last_seq
+
+    def read(self, after: int):
+        """
+        Yields the ``(seq, event, data)`` tuples published after ``after``. If the subscriber has
+        fallen behind the buffer, an ``events-lost`` event is yielded first (with the id of the
+        last lost event) and reading continues from the oldest event still held.
+
+        :param after: The last sequence number the caller has seen.
+        :type after: int
+        """
+        seq = after + 1
+        while seq <= self.last_seq:
+            if seq < self.first_seq:
+                yield self.first_seq - 1, "events-lost", json.dumps({"last_lost_id": self.first_seq - 1})
+                seq = self.first_seq
+                continue
+            if self._ring is None:
+                # Compacted while this reader was suspended; continue from the kept events.
+                yield from self._kept[bisect.bisect_left(self._kept_seqs, seq):]
+                return
+            yield self._ring[seq % self.size]
+            seq += 1
+
+    def close(self):
+        """
+        Marks the stream as complete and compacts it; subscribers stop once they have read every
+        event.
+        """
+        if not self.closed:
+            self.closed = True
+            self._compact()
+        self._notify()
+
+    def _compact(self):
+        held = (self._ring[seq % self.size] for seq in range(self.first_seq, self.last_seq + 1))
+        self._kept = [entry for entry in held if entry[1] != "token-delta"]
+        self._kept_seqs = [entry[0] for entry in self._kept]
+        self._ring = None
+        self.nbytes = sum(len(entry[2]) + EVENT_OVERHEAD_BYTES for entry in self._kept)
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait(self, after: int, timeout: float) -> bool:
+        """
+        Waits until there are events after ``after`` or the stream is closed.
+
+        :param after: The last sequence number the caller has seen.
+        :type after: int
+        :param timeout: Maximum seconds to wait.
+        :type timeout: float
+        :return: False if the wait timed out.
+        :rtype: bool
+        """
+        if self.last_seq > after or self.closed:
+            return True
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+class BroadcastHub:
+    """
+    In-process pub/sub keyed by conversation id. ``ai_conversation`` publishes each event once;
+    SSE, WebSocket and long-poll subscribers all read it from the conversation's channel.
+    """
+
+    def __init__(self):
+        self.channels = {}
+
+    def open(self, convo_id: str) -> EventChannel:
+        channel = self.channels[convo_id] = EventChannel()
+        return channel
+
+    def get(self, convo_id: str) -> Optional[EventChannel]:
+        return self.channels.get(convo_id)
+
+    def publish(self, convo_id: str, event: str, data: dict):
+        """
+        Publishes an event to a conversation's channel, if it has one.
+
+        :param convo_id: The conversation the event belongs to.
+        :type convo_id: str
+        :param event: The event type.
+        :type event: str
+        :param data: The JSON-serializable event payload.
+        :type data: dict
+        :return: None
+        """
+        channel = self.channels.get(convo_id)
+        if channel is not None:
+            channel.publish(event, data)
+
+    def close(self, convo_id: str) -> Optional[EventChannel]:
+        channel = self.channels.get(convo_id)
+        if channel is not None:
+            channel.close()
+        return channel
+
+    def discard(self, convo_id: str):
+        channel = self.channels.pop(convo_id, None)
+        if channel is not None:
+            channel.close()
+
+hub = BroadcastHub()
+
+# ==== CONVERSATION STORE ====
+STORE_MAX_CONVERSATIONS = int(os.environ.get("STORE_MAX_CONVERSATIONS", "10000"))
+STORE_MAX_BYTES = int(os.environ.get("STORE_MAX_BYTES", str(256 * 1024 * 1024)))
+STORE_IDLE_TTL_SECONDS = float(os.environ.get("STORE_IDLE_TTL_SECONDS", "3600"))
+STORE_SWEEP_INTERVAL_SECONDS = float(os.environ.get("STORE_SWEEP_INTERVAL_SECONDS", "60"))
+# Rough per-message bookkeeping cost (MessageRecord, its floats, list slot) added to the text size.
+MESSAGE_OVERHEAD_BYTES = 150
+
+class ColdStore(ABC):
+    """
+    Where finished conversations go when they are evicted from memory. Implementations must keep
+    the ``topic``, ``messages``, ``formatted_json`` and ``status`` fields of the stored record. Only
+    ended conversations reach the cold tier, so a record found there that never recorded a
+    terminal status was interrupted by a crash and is reported as failed.
+    Both methods are coroutines so implementations can do their I/O off the event loop.
+    """
+
+    @abstractmethod
+    async def put(self, convo_id: str, convo_data: dict):
+        ...
+
+    @abstractmethod
+    async def get(self, convo_id: str) -> Optional[dict]:
+        ...
+
+class ConversationStore:
+    """
+    Holds conversations in memory with LRU ordering, bounded by entry count, approximate bytes and
+    idle time. Only conversations that have ended are evicted; running ones stay until they end.
+    Evicted conversations are handed to the optional cold tier, which ``get`` falls back to.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, idle_ttl: float, cold: Optional[ColdStore] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.cold = cold
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._last_access = {}
+        self._pending = set()
+        self.total_bytes = 0
+
+    def __contains__(self, convo_id: str) -> bool:
+        return convo_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def create(self, convo_id: str, convo_data: dict):
+        """
+        Adds a new conversation and evicts others if the store is over its limits.
+
+        :param convo_id: Unique identifier of the conversation.
+        :type convo_id: str
+        :param convo_data: The conversation record.
+        :type convo_data: dict
+        :return: None
+        """
+        self._entries[convo_id] = convo_data
+        self._last_access[convo_id] = time.monotonic()
+        self._sizes[convo_id] = 0
+        self.grow(convo_id, len(convo_data.get("topic", "")) + MESSAGE_OVERHEAD_BYTES)
+
+    async def get(self, convo_id: str) -> Optional[dict]:
+        """
+        Returns a conversation, marking it recently used, or falls back to the cold tier.
+
+        :param convo_id: Unique identifier of the conversation.
+        :type convo_id: str
+        :return: The conversation record, or None if it is unknown.
+        :rtype: dict or None
+        """
+        convo_data = self._entries.get(convo_id)
+        if convo_data is not None:
+            self._entries.move_to_end(convo_id)
+            self._last_access[convo_id] = time.monotonic()
+            return convo_data
+        if self.cold is not None:
+            return await self.cold.get(convo_id)
+        return None
+
+    def grow(self, convo_id: str, nbytes: int):
+        """
+        Accounts for data added to a conversation and evicts if the store is over its limits.
+
+        :param convo_id: Unique identifier of the conversation.
+        :type convo_id: str
+        :param nbytes: Approximate number of bytes added.
+        :type nbytes: int
+        :return: None
+        """
+        if convo_id not in self._sizes:
+            return
+        self._sizes[convo_id] += nbytes
+        self.total_bytes += nbytes
+        if len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """
+        Evicts ended conversations (whose task has exited) that have been idle longer than the
+        TTL, then the least recently used ended conversations until the store is within its limits.
+
+        :return: None
+        """
+        now = time.monotonic()
+        for convo_id in list(self._entries):
+            over = len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes
+            if not over and now - self._last_access[convo_id] <= self.idle_ttl:
+                # Entries are in LRU order, so every later entry is fresher still.
+                break
+            # A conversation's task is still writing its final state until it exits, so the cold
+            # tier would otherwise race that write.
+            if self._entries[convo_id].get("status") in TERMINAL_STATUSES and convo_id not in conversation_tasks:
+                self._evict(convo_id)
+
+    def _evict(self, convo_id: str):
+        convo_data = self._entries.pop(convo_id)
+        self.total_bytes -= self._sizes.pop(convo_id)
+        del self._last_access[convo_id]
+        hub.discard(convo_id)
+        if self.cold is not None:
+            task = asyncio.ensure_future(self._put_cold(convo_id, convo_data))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    async def _put_cold(self, convo_id: str, convo_data: dict):
+        try:
+            await self.cold.put(convo_id, convo_data)
+        except Exception as e:
+            print(f"[{convo_id}] Failed to move conversation to cold storage: {e}")
+
+    async def sweep(self):
+        """
+        Periodically evicts idle conversations; runs for the lifetime of the app.
+        """
+        while True:
+            await asyncio.sleep(STORE_SWEEP_INTERVAL_SECONDS)
+            self.evict()
+
+# ==== SQLITE PERSISTENCE ====
+# Set CONVO_DB_PATH to persist every conversation and message to SQLite (WAL mode). The database
+# is written through per turn and also serves as the cold tier for evicted conversations.
+CONVO_DB_PATH = os.environ.get("CONVO_DB_PATH")
+
+class SQLiteConversationStore(ColdStore):
+    """
+    Durable conversation storage in SQLite. All access goes through one connection owned by a
+    single worker thread, so the event loop never blocks on disk and statements stay cached on
+    that connection. Each turn is written in its own short transaction; reads use the
+    ``(convo_id, idx)`` primary key.
+    """
+
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS conversations (
+            convo_id TEXT PRIMARY KEY,
+            topic TEXT NOT NULL,
+            rotation TEXT NOT NULL,
+            turns INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            status TEXT NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS messages (
+            convo_id TEXT NOT NULL,
+            idx INTEGER NOT NULL,
+            sender TEXT NOT NULL,
+            content TEXT NOT NULL,
+            PRIMARY KEY (convo_id, idx)
+        ) WITHOUT ROWID""",
+    )
+    INSERT_CONVERSATION = "INSERT OR IGNORE INTO conversations (convo_id, topic, rotation, turns, created_at, status) VALUES (?, ?, ?, ?, ?, ?)"
+    INSERT_MESSAGE = "INSERT OR REPLACE INTO messages (convo_id, idx, sender, content) VALUES (?, ?, ?, ?)"
+    FINISH_CONVERSATION = "UPDATE conversations SET status = ? WHERE convo_id = ?"
+    SELECT_CONVERSATION = "SELECT topic, status FROM conversations WHERE convo_id = ?"
+    SELECT_MESSAGES = "SELECT sender, content FROM messages WHERE convo_id = ? ORDER BY idx"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="convo-db")
+        self._conn = None
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=32)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in self.SCHEMA:
+            conn.execute(statement)
+        conn.commit()
+        self._conn = conn
+
+    async def open(self):
+        await self._run(self._open)
+
+    async def close(self):
+        if self._conn is not None:
+            await self._run(self._conn.close)
+        self._executor.shutdown(wait=False)
+
+    def _create(self, convo_id: str, topic: str, rotation: list, turns: int, status: str):
+        with self._conn:
+            self._conn.execute(self.INSERT_CONVERSATION, (convo_id, topic, json.dumps(rotation), turns, time.time(), status))
+
+    async def create(self, convo_id: str, convo_data: dict):
+        """
+        Records a new conversation.
+
+        :param convo_id: Unique identifier of the conversation.
+        :type convo_id: str
+        :param convo_data: The conversation record.
+        :type convo_data: dict
+        :return: None
+        """
+        await self._run(
+            self._create, convo_id, convo_data["topic"], convo_data.get("rotation", []), convo_data.get("turns", 0),
+            convo_data.get("status", STATUS_QUEUED),
+        )
+
+    def _write_turn(self, convo_id: str, rows: list, status: Optional[str]):
+        with self._conn:
+            self._conn.executemany(self.INSERT_MESSAGE, rows)
+            if status is not None:
+                self._conn.execute(self.FINISH_CONVERSATION, (status, convo_id))
+
+    async def write_turn(self, convo_id: str, start: int, messages: list, status: Optional[str] = None):
+        """
+        Writes the messages of a turn (and optionally the conversation's terminal status) in one
+        transaction.
+
+        :param convo_id: Unique identifier of the conversation.
+        :type convo_id: str
+        :param start: Index of the first message in ``messages``.
+        :type start: int
+        :param messages: The completed messages to write.
+        :type messages: list
+        :param status: The terminal status to record, once the conversation has ended.
+        :type status: str or None
+        :return: None
+        """
+        rows = [(convo_id, index, msg.sender, msg.content) for index, msg in enumerate(messages, start=start)]
+        await self._run(self._write_turn, convo_id, rows, status)
+
+    async def put(self, convo_id: str, convo_data: dict):
+        # Messages and the terminal status are written through by persist_turn; eviction only
+        # writes what an earlier failed write left behind.
+        start = convo_data.get("persisted", 0)
+        messages = [msg for msg in convo_data.get("messages", [])[start:] if not msg.in_progress]
+        status = convo_data.get("status")
+        if status not in TERMINAL_STATUSES or convo_data.get("persisted_status") == status:
+            status = None
+        if messages or status is not None:
+            await self.write_turn(convo_id, start, messages, status=status)
+
+    def _get(self, convo_id: str) -> Optional[dict]:
+        row = self._conn.execute(self.SELECT_CONVERSATION, (convo_id,)).fetchone()
+        if row is None:
+            return None
+        messages = [MessageRecord(sender, content) for sender, content in self._conn.execute(self.SELECT_MESSAGES, (convo_id,))]
+        return {
+            "topic": row[0],
+            "messages": messages,
+            "formatted_json": json_string_body("\n".join(f"{msg.sender}: {msg.content}" for msg in messages)),
+            "status": row[1] if row[1] in TERMINAL_STATUSES else STATUS_FAILED,
+        }
+
+    async def get(self, convo_id: str) -> Optional[dict]:
+        return await self._run(self._get, convo_id)
+
+convo_db = SQLiteConversationStore(CONVO_DB_PATH) if CONVO_DB_PATH else None
+
+conversations = ConversationStore(STORE_MAX_CONVERSATIONS, STORE_MAX_BYTES, STORE_IDLE_TTL_SECONDS, cold=convo_db)
+
+# ==== RATE LIMITING ====
+# Process-wide request and token budgets per provider. Turns proceed as soon as budget is
+# available instead of waiting a fixed delay, and concurrent conversations share the quota.
+GPT_REQUESTS_PER_MINUTE = float(os.environ.get("GPT_REQUESTS_PER_MINUTE", "500"))
+GPT_TOKENS_PER_MINUTE = float(os.environ.get("GPT_TOKENS_PER_MINUTE", "30000"))
+GEMINI_REQUESTS_PER_MINUTE = float(os.environ.get("GEMINI_REQUESTS_PER_MINUTE", "15"))
+GEMINI_TOKENS_PER_MINUTE = float(os.environ.get("GEMINI_TOKENS_PER_MINUTE", "1000000"))
+DEEPSEEK_REQUESTS_PER_MINUTE = float(os.environ.get("DEEPSEEK_REQUESTS_PER_MINUTE", "60"))
+DEEPSEEK_TOKENS_PER_MINUTE = float(os.environ.get("DEEPSEEK_TOKENS_PER_MINUTE", "100000"))
+
+class TokenBucket:
+    """
+    A token bucket refilled continuously at ``per_minute / 60`` tokens per second, holding at most
+    ``per_minute`` tokens (one minute of burst).
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        Returns how many seconds to wait before ``amount`` tokens are available (0 if now).
+        Requests larger than the bucket are clamped to its capacity so they can still proceed.
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
 
-conversations = {}
+    def consume(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
 
-def call_openai(message: str) -> str:
+class ProviderRateLimiter:
     """
-    Generate a concise response to a user-provided message by interacting with the OpenAI API.
+    Combines a requests-per-minute and a tokens-per-minute bucket for one provider. Waiters are
+    served in FIFO order so a large request cannot be starved by a stream of small ones.
+    """
+
+    def __init__(self, name: str, requests_per_minute: float, tokens_per_minute: float):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        # Created on first use: limiters are built at import time by register_provider, and on
+        # Python 3.9 a lock binds to the loop current when it is created, not the server's loop.
+        self._lock = None
+
+    async def acquire(self, tokens: int):
+        """
+        Waits until one request and ``tokens`` tokens fit in the provider's budget, then consumes them.
+
+        :param tokens: Estimated number of tokens (prompt plus completion) the request will use.
+        :type tokens: int
+        :return: None
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                if wait <= 0:
+                    self.requests.consume(1)
+                    self.tokens.consume(tokens)
+                    return
+                await asyncio.sleep(wait)
+
+    def try_acquire(self, tokens: int) -> bool:
+        """
+        Consumes one request and ``tokens`` tokens only if they are available right now and no
+        other caller is waiting, without blocking.
+
+        :param tokens: Estimated number of tokens the request will use.
+        :type tokens: int
+        :return: Whether the budget was consumed.
+        :rtype: bool
+        """
+        if (self._lock is not None and self._lock.locked()) or self.requests.wait_time(1) > 0 or self.tokens.wait_time(tokens) > 0:
+            return False
+        self.requests.consume(1)
+        self.tokens.consume(tokens)
+        return True
+
+# Populated by register_provider.
+rate_limiters = {}
+
+def estimate_tokens(prompt: str) -> int:
+    """
+    Roughly estimates the tokens a request will use: about four characters per prompt token plus
+    the full completion allowance.
+
+    :param prompt: The full prompt text sent to the provider.
+    :type prompt: str
+    :return: Estimated total token usage of the request.
+    :rtype: int
+    """
+    return len(prompt) // 4 + MAX_TOKENS_PER_MODEL
+
+# ==== RETRIES ====
+RETRY_MAX_ATTEMPTS = int(os.environ.get("RETRY_MAX_ATTEMPTS", "4"))
+RETRY_BASE_DELAY_SECONDS = float(os.environ.get("RETRY_BASE_DELAY_SECONDS", "1"))
+RETRY_MAX_DELAY_SECONDS = float(os.environ.get("RETRY_MAX_DELAY_SECONDS", "30"))
+# Each request earns RETRY_BUDGET_RATIO retry tokens (up to RETRY_BUDGET_MAX); each retry spends one.
+# This keeps retries to a bounded fraction of traffic when a provider is failing across the board.
+RETRY_BUDGET_RATIO = float(os.environ.get("RETRY_BUDGET_RATIO", "0.2"))
+RETRY_BUDGET_MAX = float(os.environ.get("RETRY_BUDGET_MAX", "10"))
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ServerError,
+    google_exceptions.DeadlineExceeded,
+    httpx.TransportError,
+    asyncio.TimeoutError,
+)
+
+class RetryBudget:
+    """
+    Caps retries as a fraction of requests for one provider. Starts full so isolated failures are
+    always retried.
+    """
+
+    def __init__(self, ratio: float, max_tokens: float):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+
+    def record_request(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+retry_budgets = {}
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Classifies a provider error by type: rate limits, timeouts, connection failures and server
+    errors are retryable; authentication, validation and other client errors are not.
+
+    :param error: The exception raised by a provider call.
+    :type error: Exception
+    :return: Whether the call should be retried.
+    :rtype: bool
+    """
+    return isinstance(error, RETRYABLE_ERRORS)
+
+def parse_duration(value: str) -> Optional[float]:
+    """
+    Parses rate-limit reset durations such as ``"1s"``, ``"250ms"`` or ``"6m0s"`` into seconds.
+
+    :param value: The header value.
+    :type value: str
+    :return: The duration in seconds, or None if the value is not a duration.
+    :rtype: float or None
+    """
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value.strip())
+    if not parts or "".join(n + u for n, u in parts) != value.strip():
+        return None
+    scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(n) * scale[u] for n, u in parts)
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """
+    Extracts the server-requested delay from a provider error, if any. Checks ``retry-after-ms``,
+    ``retry-after`` (seconds or HTTP date) and the OpenAI-style ``x-ratelimit-reset-*`` headers,
+    then Google's ``RetryInfo`` error details.
+
+    :param error: The exception raised by a provider call.
+    :type error: Exception
+    :return: The delay in seconds, or None if the server did not specify one.
+    :rtype: float or None
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers:
+        if headers.get("retry-after-ms"):
+            try:
+                return float(headers["retry-after-ms"]) / 1000
+            except ValueError:
+                pass
+        if headers.get("retry-after"):
+            value = headers["retry-after"]
+            try:
+                return float(value)
+            except ValueError:
+                try:
+                    return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+                except (TypeError, ValueError):
+                    pass
+        resets = [parse_duration(headers[h]) for h in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens") if headers.get(h)]
+        resets = [r for r in resets if r is not None]
+        if resets:
+            return max(resets)
+    for detail in getattr(error, "details", None) or []:
+        retry_delay = getattr(detail, "retry_delay", None)
+        if retry_delay is not None:
+            return retry_delay.seconds + retry_delay.nanos / 1e9
+    return None
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """
+    Computes the delay before the next attempt using exponential backoff with full jitter. A
+    server-provided Retry-After takes precedence, with a little jitter added so waiting callers
+    do not all return at the same instant; ``with_retries`` never calls this with a Retry-After
+    above ``RETRY_MAX_DELAY_SECONDS``, so the server's delay is always honoured.
+
+    :param attempt: Zero-based index of the attempt that just failed.
+    :type attempt: int
+    :param retry_after: Delay requested by the server, if any.
+    :type retry_after: float or None
+    :return: Seconds to wait, at most ``RETRY_MAX_DELAY_SECONDS``.
+    :rtype: float
+    """
+    if retry_after is not None:
+        return min(RETRY_MAX_DELAY_SECONDS, retry_after + random.uniform(0, RETRY_BASE_DELAY_SECONDS))
+    return random.uniform(0, min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * 2 ** attempt))
+
+async def with_retries(provider: str, attempt_fn):
+    """
+    Runs ``attempt_fn`` and retries retryable failures with awaitable backoff, up to
+    ``RETRY_MAX_ATTEMPTS`` attempts and subject to the provider's retry budget. When the server
+    asks for a longer wait than ``RETRY_MAX_DELAY_SECONDS``, the error is raised instead of
+    retrying early into another rejection.
+
+    :param provider: Name of the provider, used for the retry budget and log output.
+    :type provider: str
+    :param attempt_fn: Coroutine function performing one attempt of the call.
+    :return: The result of the first successful attempt.
+    :raises Exception: The last error if it is not retryable or retries are exhausted.
+    """
+    budget = retry_budgets[provider]
+    budget.record_request()
+    attempt = 0
+    while True:
+        try:
+            return await attempt_fn()
+        except Exception as e:
+            if not is_retryable(e) or attempt + 1 >= RETRY_MAX_ATTEMPTS:
+                raise
+            retry_after = retry_after_seconds(e)
+            if retry_after is not None and retry_after > RETRY_MAX_DELAY_SECONDS:
+                print(f"{provider} asked to retry after {retry_after:.0f}s, beyond the {RETRY_MAX_DELAY_SECONDS:.0f}s limit; giving up.")
+                raise
+            if not budget.try_spend():
+                raise
+            delay = backoff_delay(attempt, retry_after)
+            print(f"{provider} request failed ({type(e).__name__}); retrying in {delay:.1f}s (attempt {attempt + 2}/{RETRY_MAX_ATTEMPTS}).")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+# ==== HEDGING ====
+# Opt-in: when a request has not returned by HEDGE_PERCENTILE of the provider's recent latency,
+# a duplicate request is sent and whichever answers first wins.
+HEDGE_ENABLED = os.environ.get("HEDGE_ENABLED", "0") == "1"
+HEDGE_PERCENTILE = float(os.environ.get("HEDGE_PERCENTILE", "95"))
+HEDGE_MAX_RATE = float(os.environ.get("HEDGE_MAX_RATE", "0.1"))
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_WINDOW_SIZE = int(os.environ.get("HEDGE_WINDOW_SIZE", "200"))
+
+class LatencyTracker:
+    """
+    Keeps a provider's recent time-to-first-output latencies (until the first streamed text, or
+    the whole request if nothing streamed) and which recent requests were hedged, to derive the
+    hedge delay and enforce the hedge-rate cap. The hedge fires when no text has streamed, so the
+    delay is measured against the same quantity.
+    """
+
+    def __init__(self):
+        self.latencies = deque(maxlen=HEDGE_WINDOW_SIZE)
+        self.hedged = deque(maxlen=HEDGE_WINDOW_SIZE)
+
+    def record(self, latency: float, hedged: bool):
+        self.latencies.append(latency)
+        self.hedged.append(hedged)
+
+    def hedge_delay(self) -> Optional[float]:
+        """
+        Returns the configured latency percentile, or None while there are too few samples.
+        """
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[int(HEDGE_PERCENTILE / 100 * (len(ordered) - 1))]
+
+    def may_hedge(self) -> bool:
+        """
+        Returns whether another hedge keeps the hedged fraction of recent requests under the cap.
+        """
+        if not self.hedged:
+            return False
+        return (sum(self.hedged) + 1) / (len(self.hedged) + 1) <= HEDGE_MAX_RATE
+
+latency_trackers = {}
+
+async def hedged_request(provider: str, tokens: int, request_fn, on_partial=None):
+    """
+    Runs ``request_fn`` and, when hedging is enabled and the request has neither finished nor
+    started streaming within the provider's hedge delay, races it against a duplicate. The
+    duplicate is only sent if the hedge-rate cap and the provider's rate limit allow it without
+    waiting. The first request to stream text (or finish) wins; the other is cancelled and its
+    partial output is never published.
+
+    :param provider: Name of the provider.
+    :type provider: str
+    :param tokens: Estimated token usage, charged to the rate limiter for the duplicate.
+    :type tokens: int
+    :param request_fn: Coroutine function performing the actual request. It is called with a
+        callback that receives the partial text generated so far.
+    :param on_partial: Optional callback receiving the winning request's partial text.
+    :return: The result of whichever request succeeds first.
+    """
+    tracker = latency_trackers[provider]
+    delay = tracker.hedge_delay() if HEDGE_ENABLED else None
+    start = time.monotonic()
+    first_output = None
 
-    This function utilizes OpenAI's GPT model to create a thoughtful and concise output
+    def latency() -> float:
+        return first_output if first_output is not None else time.monotonic() - start
+
+    if delay is None:
+        def observe(text):
+            nonlocal first_output
+            if first_output is None:
+                first_output = time.monotonic() - start
+            if on_partial is not None:
+                on_partial(text)
+
+        result = await request_fn(observe)
+        tracker.record(latency(), hedged=False)
+        return result
+
+    pending = set()
+    owner = None
+
+    def launch():
+        holder = []
+
+        def emit(text):
+            nonlocal owner, first_output
+            if owner is None:
+                owner = holder[0]
+                first_output = time.monotonic() - start
+                for task in pending:
+                    if task is not owner:
+                        task.cancel()
+            if owner is holder[0] and on_partial is not None:
+                on_partial(text)
+
+        task = asyncio.ensure_future(request_fn(emit))
+        holder.append(task)
+        pending.add(task)
+
+    launch()
+    hedged = False
+    try:
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if not done and owner is None and tracker.may_hedge() and rate_limiters[provider].try_acquire(tokens):
+            print(f"{provider} request exceeded {delay:.2f}s; sending hedge request.")
+            launch()
+            hedged = True
+        error = None
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            pending.difference_update(done)
+            for task in done:
+                if not task.cancelled() and task.exception() is None:
+                    tracker.record(latency(), hedged=hedged)
+                    return task.result()
+                if not task.cancelled():
+                    error = error or task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+# ==== CIRCUIT BREAKERS ====
+BREAKER_WINDOW_SIZE = int(os.environ.get("BREAKER_WINDOW_SIZE", "20"))
+BREAKER_MIN_CALLS = int(os.environ.get("BREAKER_MIN_CALLS", "5"))
+BREAKER_FAILURE_RATE = float(os.environ.get("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_SLOW_CALL_SECONDS = float(os.environ.get("BREAKER_SLOW_CALL_SECONDS", "20"))
+BREAKER_SLOW_CALL_RATE = float(os.environ.get("BREAKER_SLOW_CALL_RATE", "0.8"))
+BREAKER_OPEN_SECONDS = float(os.environ.get("BREAKER_OPEN_SECONDS", "30"))
+BREAKER_HALF_OPEN_PROBES = int(os.environ.get("BREAKER_HALF_OPEN_PROBES", "2"))
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit breaker is open."""
+
+    def __init__(self, provider: str):
+        super().__init__(f"{provider} circuit is open")
+        self.provider = provider
+
+class CircuitBreaker:
+    """
+    Tracks the outcome of recent calls to one provider over a sliding window. The breaker opens
+    when the failure rate or the slow-call rate crosses its threshold, rejects calls while open,
+    and after ``open_seconds`` lets a few probe calls through (half-open). It closes again once
+    all probes succeed and re-opens if any probe fails.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = self.CLOSED
+        self.outcomes = deque(maxlen=BREAKER_WINDOW_SIZE)
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        self.probe_successes = 0
+
+    def available(self) -> bool:
+        """
+        Returns whether ``allow`` would currently let a call through, without changing state or
+        reserving a probe slot. An open circuit whose open period has expired counts as available,
+        so the call that follows can probe it.
+        """
+        if self.state == self.OPEN:
+            return time.monotonic() - self.opened_at >= BREAKER_OPEN_SECONDS
+        if self.state == self.HALF_OPEN:
+            return self.probes_in_flight < BREAKER_HALF_OPEN_PROBES
+        return True
+
+    def allow(self) -> bool:
+        """
+        Returns whether a call may proceed, reserving a probe slot when half-open.
+        """
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < BREAKER_OPEN_SECONDS:
+                return False
+            self.state = self.HALF_OPEN
+            self.probes_in_flight = 0
+            self.probe_successes = 0
+            print(f"{self.name} circuit half-open; probing.")
+        if self.state == self.HALF_OPEN:
+            if self.probes_in_flight >= BREAKER_HALF_OPEN_PROBES:
+                return False
+            self.probes_in_flight += 1
+        return True
+
+    def release(self):
+        """
+        Frees a reserved probe slot without recording an outcome (e.g. the call was cancelled).
+        """
+        if self.state == self.HALF_OPEN:
+            self.probes_in_flight = max(0, self.probes_in_flight - 1)
+
+    def record(self, success: bool, latency: float):
+        """
+        Records the outcome of a call that :meth:`allow` let through.
+
+        :param success: Whether the call succeeded.
+        :type success: bool
+        :param latency: Duration of the call in seconds.
+        :type latency: float
+        """
+        slow = latency >= BREAKER_SLOW_CALL_SECONDS
+        if self.state == self.HALF_OPEN:
+            self.probes_in_flight = max(0, self.probes_in_flight - 1)
+            if not success or slow:
+                self._trip()
+                return
+            self.probe_successes += 1
+            if self.probe_successes >= BREAKER_HALF_OPEN_PROBES:
+                self.state = self.CLOSED
+                self.outcomes.clear()
+                print(f"{self.name} circuit closed.")
+            return
+        if self.state == self.OPEN:
+            return
+        self.outcomes.append((success, slow))
+        if len(self.outcomes) < BREAKER_MIN_CALLS:
+            return
+        failure_rate = sum(1 for ok, _ in self.outcomes if not ok) / len(self.outcomes)
+        slow_rate = sum(1 for _, was_slow in self.outcomes if was_slow) / len(self.outcomes)
+        if failure_rate >= BREAKER_FAILURE_RATE or slow_rate >= BREAKER_SLOW_CALL_RATE:
+            self._trip()
+
+    def _trip(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.outcomes.clear()
+        print(f"{self.name} circuit opened for {BREAKER_OPEN_SECONDS:.0f}s.")
+
+circuit_breakers = {}
+
+async def call_provider(provider: str, tokens: int, request_fn, on_partial=None):
+    """
+    Calls a provider through its circuit breaker, rate limiter and the shared retry policy. Each
+    attempt checks the breaker first, so an open circuit fails fast without queueing for quota.
+
+    :param provider: Name of the provider.
+    :type provider: str
+    :param tokens: Estimated token usage of one request, charged to the rate limiter per attempt.
+    :type tokens: int
+    :param request_fn: Coroutine function performing the actual request, called with a callback
+        for the partial text generated so far.
+    :param on_partial: Optional callback receiving the partial text as it streams in. A retried
+        attempt starts again from an empty text.
+    :return: The result of ``request_fn``.
+    :raises CircuitOpenError: If the provider's circuit is open.
+    """
+    breaker = circuit_breakers[provider]
+
+    async def attempt():
+        if not breaker.allow():
+            raise CircuitOpenError(provider)
+        start = time.monotonic()
+        try:
+            await rate_limiters[provider].acquire(tokens)
+            start = time.monotonic()
+            result = await hedged_request(provider, tokens, request_fn, on_partial)
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except Exception:
+            breaker.record(False, time.monotonic() - start)
+            raise
+        breaker.record(True, time.monotonic() - start)
+        return result
+
+    return await with_retries(provider, attempt)
+
+# ==== PROVIDERS ====
+AUTO_PROVIDER = "auto"
+DEFAULT_ROTATION = [name.strip() for name in os.environ.get("DEFAULT_ROTATION", "GPT,Gemini,DeepSeek").split(",") if name.strip()]
+
+@dataclass
+class Provider:
+    """
+    A registered conversation backend. ``kind`` selects the call implementation: ``"openai"`` for
+    any OpenAI-compatible chat completions endpoint, ``"gemini"`` for Google's Gemini API.
+    ``params`` are passed through as generation parameters.
+    """
+
+    name: str
+    kind: str
+    model: str
+    system_prompt: str
+    api_key: str
+    base_url: Optional[str] = None
+    params: dict = field(default_factory=dict)
+    requests_per_minute: float = 60
+    tokens_per_minute: float = 100000
+    color: str = ""
+    call: Optional[Callable[..., Awaitable[str]]] = None
+    # OpenAI-compatible client, created in the app lifespan hook.
+    client: Optional[AsyncOpenAI] = None
+
+providers = {}
+
+def register_provider(provider: Provider):
+    """
+    Adds a provider to the registry, wiring its call implementation, rate limiter, retry budget,
+    latency tracker and circuit breaker. Registering a name again replaces the previous entry.
+
+    :param provider: The provider to register.
+    :type provider: Provider
+    :return: None
+    """
+    if provider.call is None:
+        provider.call = PROVIDER_CALLS[provider.kind]
+    providers[provider.name] = provider
+    rate_limiters[provider.name] = ProviderRateLimiter(provider.name, provider.requests_per_minute, provider.tokens_per_minute)
+    retry_budgets[provider.name] = RetryBudget(RETRY_BUDGET_RATIO, RETRY_BUDGET_MAX)
+    latency_trackers[provider.name] = LatencyTracker()
+    circuit_breakers[provider.name] = CircuitBreaker(provider.name)
+
+def pick_provider(exclude: Optional[str] = None) -> str:
+    """
+    Picks the registered provider with the most spare capacity: providers whose circuit would
+    reject the call are skipped (an open circuit becomes eligible again once it is due a probe),
+    and the one whose rate limiter could serve a request soonest wins. The previous speaker is
+    avoided when another provider is available.
+
+    :param exclude: Name of a provider to avoid, typically the previous speaker.
+    :type exclude: str or None
+    :return: The chosen provider name.
+    :rtype: str
+    """
+    candidates = [name for name in providers if circuit_breakers[name].available()]
+    if len(candidates) > 1 and exclude in candidates:
+        candidates.remove(exclude)
+    if not candidates:
+        candidates = list(providers)
+
+    def wait(name):
+        limiter = rate_limiters[name]
+        return max(limiter.requests.wait_time(1), limiter.tokens.wait_time(MAX_TOKENS_PER_MODEL))
+
+    return min(candidates, key=lambda name: (wait(name), random.random()))
+
+async def call_openai(provider: Provider, message: str, on_partial=None) -> str:
+    """
+    Generate a concise response to a user-provided message by interacting with an
+    OpenAI-compatible chat completions API (OpenAI itself, DeepSeek, or any extra endpoint).
+    The completion is streamed, and the text generated so far is passed to ``on_partial``
+    after each chunk.
+
+    This function utilizes the provider's model to create a thoughtful and concise output
     based on an incoming message. The configuration includes options like setting the
     response length limit, specifying a temperature level for randomness, and properly
-    structuring the prompt for the system and user roles in the conversation.
+    structuring the prompt for the system and user roles in the conversation. Transient
+    failures are retried through the shared retry policy.
 
+    :param provider: The registered provider to call.
+    :type provider: Provider
     :param message: The input message provided by the user to generate a response.
     :type message: str
-    :return: A concise response generated by the OpenAI GPT model.
+    :param on_partial: Optional callback receiving the partial response text as it streams in.
+    :type on_partial: callable
+    :return: A concise response generated by the provider's model.
     :rtype: str
+    :raises CircuitOpenError: If the provider's circuit is open.
+    :raises Exception: The provider's error, once retries are exhausted or it is not retryable.
     """
-    try:
-        response = openai.chat.completions.create(
-            model="gpt-4.1",
+    async def request(emit):
+        response_stream = await provider.client.chat.completions.create(
+            model=provider.model,
             messages=[
-                {"role": "system", "content": "Provide a thoughtful, critical, and objective response to the previous message. You may offer a different, fact-based perspective when appropriate. Keep responses concise (2–3 sentences). Avoid bullet points. You may also be edgy if necessary."},
+                {"role": "system", "content": provider.system_prompt},
                 {"role": "user", "content": message}
             ],
-            max_tokens=MAX_TOKENS_PER_MODEL,
-            temperature=0.7,
+            stream=True,
+            **provider.params,
         )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        print(f"Error calling OpenAI: {e}")
-        return f"Error generating OpenAI response: {e}"
 
-def call_gemini(message: str, retry_count: int = 0) -> str:
+        parts = []
+        async for chunk in response_stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                emit("".join(parts).strip())
+
+        return "".join(parts).strip()
+
+    return await call_provider(provider.name, estimate_tokens(message), request, on_partial)
+
+@lru_cache(maxsize=8)
+def get_gemini_model(
+    model_name: str,
+    max_output_tokens: int,
+    temperature: float,
+    top_p: float,
+    top_k: int,
+) -> Tuple[genai.GenerativeModel, genai.types.GenerationConfig]:
+    """
+    Returns the Gemini model handle and generation config for the given settings, building them
+    only once. The model handle keeps its underlying client channel, so every conversation reuses
+    the same connection. Because the cache is keyed by model name and generation parameters, a
+    configuration change yields a fresh handle; call ``get_gemini_model.cache_clear()`` after
+    re-running ``genai.configure``.
+
+    :param model_name: Name of the Gemini model to use.
+    :type model_name: str
+    :param max_output_tokens: Maximum number of tokens to generate.
+    :type max_output_tokens: int
+    :param temperature: Sampling temperature.
+    :type temperature: float
+    :param top_p: Nucleus sampling probability mass.
+    :type top_p: float
+    :param top_k: Top-k sampling cutoff.
+    :type top_k: int
+    :return: The cached model handle and its generation config.
+    :rtype: tuple
+    """
+    model = genai.GenerativeModel(model_name)
+    generation_config = genai.types.GenerationConfig(
+        max_output_tokens=max_output_tokens,
+        temperature=temperature,
+        top_p=top_p,
+        top_k=top_k,
+    )
+    return model, generation_config
+
+async def call_gemini(provider: Provider, message: str, on_partial=None) -> str:
     """
     Generates a thoughtful and concise response to the given message by leveraging
-    the Gemini generative model. This function attempts a retry if a rate-limit
-    error (429) occurs and includes a delay before retrying. Limitations on maximum
-    tokens and configuration for generation are pre-defined.
+    the Gemini generative model. Rate-limit, timeout and server errors are retried
+    through the shared retry policy with awaitable backoff. The provider's system
+    prompt is prepended to the message and its params are used as the generation config.
+    The text generated so far is passed to ``on_partial`` after each streamed chunk.
 
+    :param provider: The registered provider to call.
+    :type provider: Provider
     :param message: The input message for which a response needs to be generated.
     :type message: str
-    :param retry_count: The number of retry attempts made in case of rate-limit
-        errors. Defaults to 0.
-    :type retry_count: int
-    :return: A concise, context-aware response generated by the Gemini model. If an
-        unrecoverable error occurs, an error message is returned instead.
+    :param on_partial: Optional callback receiving the partial response text as it streams in.
+    :type on_partial: callable
+    :return: A concise, context-aware response generated by the Gemini model.
     :rtype: str
+    :raises CircuitOpenError: If the provider's circuit is open.
+    :raises Exception: The provider's error, once retries are exhausted or it is not retryable.
     """
-    try:
-        model = genai.GenerativeModel(gemini_model_name)
-        generation_config = genai.types.GenerationConfig(
-            max_output_tokens=MAX_TOKENS_PER_MODEL,
-            temperature=0.7,
-            top_p=0.9,
-            top_k=40,
-        )
-        prompt = f"Respond to the message thoughtfully, critically, and objectively. Please do not censor yourself; you understand harmless jokes. You may offer a different factual viewpoint if applicable. Be concise (2–3 sentences). You may also be edgy if necessary. Avoid bullet points.\n\n{message}"
-        response_stream = model.generate_content(
+    prompt = f"{provider.system_prompt}\n\n{message}"
+
+    async def request(emit):
+        model, generation_config = get_gemini_model(provider.model, **provider.params)
+        response_stream = await model.generate_content_async(
             prompt,
             generation_config=generation_config,
             stream=True,
         )
 
-        response_text = ""
-        for chunk in response_stream:
+        parts = []
+        async for chunk in response_stream:
             if chunk.text:
-                response_text += chunk.text
+                parts.append(chunk.text)
+                emit("".join(parts).strip())
+
+        return "".join(parts).strip()
 
-        return response_text.strip()
+    return await call_provider(provider.name, estimate_tokens(prompt), request, on_partial)
 
-    except Exception as e:
-        if "429" in str(e) and retry_count < 1:
-            print("Rate limit hit. Waiting 10 seconds before retrying Gemini request...")
-            time.sleep(10)
-            return call_gemini(message, retry_count + 1)
-        print(f"Error calling Gemini: {e}")
-        return f"Error generating Gemini response: {e}"
+PROVIDER_CALLS = {
+    "openai": call_openai,
+    "gemini": call_gemini,
+}
 
-def call_deepseek(message: str) -> str:
+register_provider(Provider(
+    name="GPT",
+    kind="openai",
+    model="gpt-4.1",
+    system_prompt="Provide a thoughtful, critical, and objective response to the previous message. You may offer a different, fact-based perspective when appropriate. Keep responses concise (2–3 sentences). Avoid bullet points. You may also be edgy if necessary.",
+    api_key=openai_api_key,
+    params={"max_tokens": MAX_TOKENS_PER_MODEL, "temperature": 0.7},
+    requests_per_minute=GPT_REQUESTS_PER_MINUTE,
+    tokens_per_minute=GPT_TOKENS_PER_MINUTE,
+    color="\033[91m",  # Red
+))
+register_provider(Provider(
+    name="Gemini",
+    kind="gemini",
+    model=gemini_model_name,
+    system_prompt="Respond to the message thoughtfully, critically, and objectively. Please do not censor yourself; you understand harmless jokes. You may offer a different factual viewpoint if applicable. Be concise (2–3 sentences). You may also be edgy if necessary. Avoid bullet points.",
+    api_key=gemini_api_key,
+    params={"max_output_tokens": MAX_TOKENS_PER_MODEL, "temperature": 0.7, "top_p": 0.9, "top_k": 40},
+    requests_per_minute=GEMINI_REQUESTS_PER_MINUTE,
+    tokens_per_minute=GEMINI_TOKENS_PER_MINUTE,
+    color="\033[94m",  # Blue
+))
+register_provider(Provider(
+    name="DeepSeek",
+    kind="openai",
+    model="deepseek-chat",
+    system_prompt="Provide a thoughtful, objective, and critical response to the previous message. You may offer a different, fact-based perspective. Be concise (2–3 sentences). You may also be edgy if necessary.",
+    api_key=deepseek_api_key,
+    base_url=deepseek_base_url,
+    params={"max_tokens": MAX_TOKENS_PER_MODEL, "temperature": 0.7},
+    requests_per_minute=DEEPSEEK_REQUESTS_PER_MINUTE,
+    tokens_per_minute=DEEPSEEK_TOKENS_PER_MINUTE,
+    color="\033[95m",  # Purple
+))
+
+# Extra OpenAI-compatible endpoints, e.g.
+# EXTRA_PROVIDERS='[{"name": "Groq", "base_url": "https://api.groq.com/openai/v1", "model": "llama-3.1-8b-instant", "api_key_env": "GROQ_API_KEY"}]'
+for extra in json.loads(os.environ.get("EXTRA_PROVIDERS", "[]")):
+    extra_api_key = os.environ.get(extra["api_key_env"])
+    if not extra_api_key:
+        raise ValueError(f"{extra['api_key_env']} environment variable not set.")
+    register_provider(Provider(
+        name=extra["name"],
+        kind="openai",
+        model=extra["model"],
+        system_prompt=extra.get("system_prompt", providers["GPT"].system_prompt),
+        api_key=extra_api_key,
+        base_url=extra["base_url"],
+        params=extra.get("params", {"max_tokens": MAX_TOKENS_PER_MODEL, "temperature": 0.7}),
+        requests_per_minute=extra.get("requests_per_minute", 60),
+        tokens_per_minute=extra.get("tokens_per_minute", 100000),
+    ))
+
+# ==== TRANSCRIPT JOURNAL ====
+# Each conversation is journaled to {TRANSCRIPT_DIR}/ab/cd/{convo_id}.jsonl, where ab/cd are the
+# first bytes of a hash of the id (TRANSCRIPT_SHARD_DEPTH levels), one JSON line per record,
+# appended as each turn completes. Appends are group-committed through a shared log under
+# {TRANSCRIPT_DIR}/log, rolled at TRANSCRIPT_LOG_SEGMENT_BYTES. TRANSCRIPT_FSYNC is "always"
+# (fsync the log every batch), "interval" (at most once per TRANSCRIPT_FSYNC_INTERVAL_SECONDS) or
+# "never" (leave it to the OS); a conversation's own file is fsynced once, when it ends.
+TRANSCRIPT_JOURNAL_ENABLED = os.environ.get("TRANSCRIPT_JOURNAL_ENABLED", "1") == "1"
+TRANSCRIPT_DIR = os.environ.get("TRANSCRIPT_DIR", ".")
+TRANSCRIPT_FSYNC = os.environ.get("TRANSCRIPT_FSYNC", "interval")
+TRANSCRIPT_FSYNC_INTERVAL_SECONDS = float(os.environ.get("TRANSCRIPT_FSYNC_INTERVAL_SECONDS", "1"))
+TRANSCRIPT_QUEUE_SIZE = int(os.environ.get("TRANSCRIPT_QUEUE_SIZE", "10000"))
+TRANSCRIPT_BATCH_MAX_APPENDS = int(os.environ.get("TRANSCRIPT_BATCH_MAX_APPENDS", "1000"))
+TRANSCRIPT_SHARD_DEPTH = int(os.environ.get("TRANSCRIPT_SHARD_DEPTH", "2"))
+TRANSCRIPT_LOG_SEGMENT_BYTES = int(os.environ.get("TRANSCRIPT_LOG_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+# Finished transcripts are compressed (zstd when the zstandard package is installed, else gzip)
+# and either kept next to the journal as {convo_id}.jsonl.zst/.gz or, with the archive enabled,
+# appended to a rolling archive under {TRANSCRIPT_DIR}/archive.
+TRANSCRIPT_COMPRESS = os.environ.get("TRANSCRIPT_COMPRESS", "1") == "1"
+TRANSCRIPT_ARCHIVE_ENABLED = os.environ.get("TRANSCRIPT_ARCHIVE_ENABLED", "0") == "1"
+TRANSCRIPT_ARCHIVE_SEGMENT_BYTES = int(os.environ.get("TRANSCRIPT_ARCHIVE_SEGMENT_BYTES", str(256 * 1024 * 1024)))
+
+def compress_transcript(data: bytes) -> Tuple[bytes, str]:
     """
-    Processes input message and generates a response using the DeepSeek service. This function utilizes
-    the DeepSeek client's `chat.completions.create` method to send a message and receive a response.
-    The response is expected to be concise and fact-based, adhering to preset parameters for model
-    behavior such as token limitation and temperature control.
+    Compresses a finished transcript with the best available codec.
 
-    :param message: Input string containing the user message to which a response is generated.
-    :type message: str
-    :return: Generated response string from the DeepSeek service, or an error description if the
-             service call fails.
-    :rtype: str
+    :param data: The raw journal bytes.
+    :type data: bytes
+    :return: The compressed bytes and the codec's file suffix ("zst" or "gz").
+    :rtype: Tuple[bytes, str]
     """
-    try:
-        response = deepseek_client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {"role": "system", "content": "Provide a thoughtful, objective, and critical response to the previous message. You may offer a different, fact-based perspective. Be concise (2–3 sentences). You may also be edgy if necessary."},
-                {"role": "user", "content": message}
-            ],
-            max_tokens=MAX_TOKENS_PER_MODEL,
-            temperature=0.7,
+    if ZSTD_AVAILABLE:
+        return zstandard.ZstdCompressor().compress(data), "zst"
+    return gzip.compress(data), "gz"
+
+def decompress_transcript(blob: bytes, codec: str) -> bytes:
+    """
+    Reverses :func:`compress_transcript`.
+
+    :param blob: The compressed bytes.
+    :type blob: bytes
+    :param codec: The codec suffix returned by :func:`compress_transcript`.
+    :type codec: str
+    :return: The raw journal bytes.
+    :rtype: bytes
+    """
+    if codec == "zst":
+        return zstandard.ZstdDecompressor().decompress(blob)
+    return gzip.decompress(blob)
+
+def parse_journal(data: bytes) -> List[dict]:
+    """
+    Splits raw journal bytes into records. Lines that do not decode, such as a torn final line
+    left by a crash mid-append, are skipped.
+    """
+    records = []
+    # Records are written with ensure_ascii=False, so split on "\n" only: splitlines() would also
+    # break lines at U+2028 and friends inside message content.
+    for line in data.decode("utf-8", errors="replace").split("\n"):
+        if not line:
+            continue
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue
+    return records
+
+def conversation_from_journal(records: List[dict]) -> dict:
+    """
+    Rebuilds a stored conversation from its journal records, keeping the fields the
+    conversation store's cold tier must provide.
+
+    :param records: The conversation's journal records.
+    :type records: List[dict]
+    :return: The conversation with ``topic``, ``messages``, ``formatted_json`` and ``status``.
+    :rtype: dict
+    """
+    topic = ""
+    by_index = {}
+    status = STATUS_FAILED
+    for record in records:
+        if record["type"] == "conversation":
+            topic = record["topic"]
+        elif record["type"] == "message":
+            # An append interrupted by a cancellation may have been written and then retried.
+            by_index[record["index"]] = MessageRecord(record["sender"], record["content"])
+        elif record["type"] == "finished":
+            status = record.get("status", STATUS_FINISHED)
+    messages = [by_index[index] for index in sorted(by_index)]
+    return {
+        "topic": topic,
+        "messages": messages,
+        "formatted_json": json_string_body("\n".join(f"{msg.sender}: {msg.content}" for msg in messages)),
+        "status": status,
+    }
+
+class TranscriptArchive:
+    """
+    Rolling archive of finished, compressed transcripts. Each transcript is appended to a segment
+    file (archive-000001.bin, ...) as a 4-byte little-endian length followed by the compressed
+    journal, so a segment can be walked without its index. Each segment also has a line-delimited
+    index (archive-000001.idx) of convo_id, payload offset, length and codec; a new segment is
+    started once the current one reaches ``segment_bytes``.
+
+    The indexes are loaded into memory on startup and segments are read through ``mmap``, so a
+    cold lookup is a dict probe plus a slice of the mapping. Archived conversations are read
+    back through :meth:`TranscriptJournal.read`.
+    """
+
+    LENGTH_PREFIX = struct.Struct("<I")
+
+    def __init__(self, directory: str, segment_bytes: int):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segment = 1
+        self.index = {}
+        self._maps = {}
+        self._maps_lock = threading.Lock()
+
+    def _path(self, segment: int, suffix: str) -> str:
+        return os.path.join(self.directory, f"archive-{segment:06d}.{suffix}")
+
+    def load(self):
+        """
+        Creates the archive directory if needed and loads every segment's index. Unreadable index
+        lines are skipped. If the newest index ends in a torn line from a crash mid-write, writing
+        moves on to a fresh segment so later entries are never appended onto the partial line.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        torn = set()
+        for name in sorted(os.listdir(self.directory)):
+            match = re.fullmatch(r"archive-(\d+)\.idx", name)
+            if not match:
+                continue
+            segment = int(match.group(1))
+            self.segment = max(self.segment, segment)
+            with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                for line in f:
+                    if not line.endswith("\n"):
+                        torn.add(segment)
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.index[entry["convo_id"]] = (segment, entry["offset"], entry["length"], entry["codec"])
+        if self.segment in torn:
+            self.segment += 1
+
+    def close(self):
+        """
+        Unmaps all segments.
+        """
+        with self._maps_lock:
+            for segment_map in self._maps.values():
+                try:
+                    segment_map.close()
+                except BufferError:
+                    pass  # still being read; unmapped when that reader lets go
+            self._maps.clear()
+
+    def add(self, convo_id: str, blob: bytes, codec: str):
+        """
+        Appends a compressed transcript to the current segment and records it in the index.
+        The blob is fsynced before its index line is written, so the index never points at
+        data that is not on disk.
+        """
+        data_path = self._path(self.segment, "bin")
+        if os.path.exists(data_path) and os.path.getsize(data_path) >= self.segment_bytes:
+            self.segment += 1
+            data_path = self._path(self.segment, "bin")
+        with open(data_path, "ab") as f:
+            offset = f.tell() + self.LENGTH_PREFIX.size
+            f.write(self.LENGTH_PREFIX.pack(len(blob)) + blob)
+            f.flush()
+            os.fsync(f.fileno())
+        entry = {"convo_id": convo_id, "offset": offset, "length": len(blob), "codec": codec}
+        with open(self._path(self.segment, "idx"), "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.index[convo_id] = (self.segment, offset, len(blob), codec)
+
+    def _map(self, segment: int, end: int) -> mmap.mmap:
+        # The current segment keeps growing, so it is remapped when a read runs past the mapping.
+        # The old mapping is not closed here: a concurrent reader may still be slicing it, and it
+        # is unmapped once the last reference goes.
+        segment_map = self._maps.get(segment)
+        if segment_map is None or len(segment_map) < end:
+            with open(self._path(segment, "bin"), "rb") as f:
+                segment_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = segment_map
+        return segment_map
+
+    def read(self, convo_id: str) -> Optional[bytes]:
+        """
+        Returns a conversation's raw journal bytes, or None if it is not archived.
+        """
+        entry = self.index.get(convo_id)
+        if entry is None:
+            return None
+        segment, offset, length, codec = entry
+        with self._maps_lock:
+            segment_map = self._map(segment, offset + length)
+        with memoryview(segment_map) as view, view[offset:offset + length] as blob:
+            return decompress_transcript(blob, codec)
+
+
+class TranscriptJournal(ColdStore):
+    """
+    Append-only, line-delimited transcript files. A crash loses at most the turn being written,
+    and each append costs O(turn) I/O instead of rewriting the whole transcript.
+
+    All appends go through one bounded queue drained by a single writer task, which takes
+    whatever has queued up while the previous batch was on disk and group-commits it: the records
+    of every conversation in the batch are written to a shared log in one write and made durable
+    with one fsync (as ``fsync_policy`` allows), then appended to their conversations' files
+    without an fsync. A conversation's file is fsynced once, when it ends, and a log segment is
+    deleted once every conversation with records in it has ended. On startup, records that
+    reached the log but not their conversation's file are replayed into it. Callers wait until
+    their records are written; when the queue is full they wait to enqueue, which is the
+    backpressure reported in ``stats``.
+
+    Finished journals are compressed (and archived) on a separate worker thread, so a finishing
+    conversation does not hold up other conversations' appends. Without a database, the journal
+    is the conversation store's cold tier: ``get`` reads a conversation back from wherever its
+    transcript currently lives.
+    """
+
+    def __init__(self, directory: str, fsync_policy: str, fsync_interval: float,
+                 archive: Optional[TranscriptArchive] = None):
+        self.directory = directory
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.archive = archive
+        self.log_directory = os.path.join(directory, "log")
+        self._log = None
+        self._log_segment = 0
+        # Conversations that have records in each log segment and have not ended yet.
+        self._segment_convos = {}
+        self._last_fsync = 0.0
+        self._log_torn = False
+        self._torn = set()
+        self._queue = None
+        self._writer = None
+        self._compressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="transcript-compress")
+        self._compressing = set()
+        self.stats = {
+            "batches": 0,
+            "records": 0,
+            "fsyncs": 0,
+            "max_batch_size": 0,
+            "max_queue_depth": 0,
+            "full_queue_waits": 0,
+            "enqueue_wait_seconds": 0.0,
+            "compressed": 0,
+        }
+
+    def path(self, convo_id: str) -> str:
+        digest = hashlib.sha1(convo_id.encode("utf-8")).hexdigest()
+        shards = [digest[2 * i:2 * i + 2] for i in range(TRANSCRIPT_SHARD_DEPTH)]
+        return os.path.join(self.directory, *shards, f"{convo_id}.jsonl")
+
+    def _log_path(self, segment: int) -> str:
+        return os.path.join(self.log_directory, f"log-{segment:06d}.jsonl")
+
+    def _compressed(self, convo_id: str) -> bool:
+        path = self.path(convo_id)
+        if self.archive is not None and convo_id in self.archive.index:
+            return True
+        return any(os.path.exists(f"{path}.{codec}") for codec in ("zst", "gz"))
+
+    def _recover(self):
+        """
+        Replays log records missing from their conversations' files, which are only fsynced when
+        a conversation ends, then removes the replayed log segments.
+        """
+        os.makedirs(self.log_directory, exist_ok=True)
+        segments = sorted(
+            int(match.group(1)) for match in
+            (re.fullmatch(r"log-(\d+)\.jsonl", name) for name in os.listdir(self.log_directory)) if match
         )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        print(f"Error calling DeepSeek: {e}")
-        return f"Error generating DeepSeek response: {e}"
+        pending = {}
+        for segment in segments:
+            with open(self._log_path(segment), encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn line from a crash mid-write
+                    pending.setdefault(entry["convo_id"], []).append(json.dumps(entry["record"], ensure_ascii=False))
+        for convo_id, lines in pending.items():
+            path = self.path(convo_id)
+            if not os.path.exists(path) and self._compressed(convo_id):
+                continue  # ended and compressed, so its file was already complete and on disk
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "a+", encoding="utf-8") as f:
+                f.seek(0)
+                data = f.read()
+                written = set(data.split("\n"))
+                missing = "".join(line + "\n" for line in lines if line not in written)
+                if missing and data and not data.endswith("\n"):
+                    missing = "\n" + missing
+                f.write(missing)
+                f.flush()
+                if self.fsync_policy != "never":
+                    os.fsync(f.fileno())
+        for segment in segments:
+            os.remove(self._log_path(segment))
+        self._log_segment = segments[-1] if segments else 0
+
+    def _roll_log(self):
+        if self._log is not None:
+            self._log.close()
+        self._log_segment += 1
+        self._log = open(self._log_path(self._log_segment), "a", encoding="utf-8")
+        self._segment_convos[self._log_segment] = set()
+
+    def _release_segments(self):
+        # The current segment is never deleted; it is released after the next roll.
+        for segment in [segment for segment, convos in self._segment_convos.items() if not convos]:
+            if segment != self._log_segment:
+                os.remove(self._log_path(segment))
+                del self._segment_convos[segment]
+
+    def start(self):
+        """
+        Loads the archive index, replays the log left by the previous run and starts the
+        background writer; called from the app lifespan hook.
+        """
+        if self.archive is not None:
+            self.archive.load()
+        self._recover()
+        self._roll_log()
+        self._queue = asyncio.Queue(maxsize=TRANSCRIPT_QUEUE_SIZE)
+        self._writer = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Waits for queued appends to be written and finished journals to be compressed, then stops
+        the background writer.
+        """
+        if self._writer is None:
+            return
+        await self._queue.join()
+        self._writer.cancel()
+        self._writer = None
+        await asyncio.gather(*self._compressing, return_exceptions=True)
+        self._compressor.shutdown(wait=False)
+        self._log.close()
+        self._log = None
+        if not self._segment_convos.get(self._log_segment):
+            os.remove(self._log_path(self._log_segment))
+            self._segment_convos.pop(self._log_segment, None)
+        if self.archive is not None:
+            self.archive.close()
 
-def ai_conversation(convo_id: str):
+    async def append(self, convo_id: str, records: list, final: bool = False):
+        """
+        Queues records for a conversation's journal and waits until they are written.
+
+        :param convo_id: Unique identifier of the conversation.
+        :type convo_id: str
+        :param records: JSON-serializable records, one line each.
+        :type records: list
+        :param final: Whether this is the conversation's last append.
+        :type final: bool
+        :return: None
+        """
+        lines = [json.dumps(record, ensure_ascii=False) for record in records]
+        done = asyncio.get_running_loop().create_future()
+        if self._queue.full():
+            self.stats["full_queue_waits"] += 1
+        start = time.monotonic()
+        await self._queue.put((convo_id, lines, final, done))
+        self.stats["enqueue_wait_seconds"] += time.monotonic() - start
+        self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], self._queue.qsize())
+        await done
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < TRANSCRIPT_BATCH_MAX_APPENDS and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+                for convo_id, _, final, done in batch:
+                    if not done.done():
+                        done.set_result(None)
+                    if final and TRANSCRIPT_COMPRESS:
+                        self._schedule_compress(convo_id)
+            except Exception as e:
+                for *_, done in batch:
+                    if not done.done():
+                        done.set_exception(e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write_batch(self, batch: list):
+        files = {}
+        log_lines = []
+        for convo_id, lines, final, _ in batch:
+            pending = files.setdefault(convo_id, [[], False])
+            pending[0].extend(lines)
+            pending[1] = pending[1] or final
+            prefix = '{"convo_id":' + json.dumps(convo_id) + ',"record":'
+            log_lines.extend(prefix + line + "}\n" for line in lines)
+            self.stats["records"] += len(lines)
+
+        # One write and at most one fsync commit the whole batch.
+        data = "".join(log_lines)
+        if self._log_torn:
+            data = "\n" + data
+        self._log_torn = True
+        self._log.write(data)
+        self._log.flush()
+        self._log_torn = False
+        now = time.monotonic()
+        if self.fsync_policy == "always" or (
+            self.fsync_policy == "interval" and now - self._last_fsync >= self.fsync_interval
+        ):
+            os.fsync(self._log.fileno())
+            self._last_fsync = now
+            self.stats["fsyncs"] += 1
+        self._segment_convos[self._log_segment].update(files)
+
+        # The log makes the records durable, so conversation files are only fsynced when they end.
+        for convo_id, (lines, final) in files.items():
+            path = self.path(convo_id)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # A failed write may have left a partial line; the retry starts on a fresh one.
+            data = "".join(line + "\n" for line in lines)
+            if convo_id in self._torn:
+                data = "\n" + data
+            self._torn.add(convo_id)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(data)
+                f.flush()
+                if final and self.fsync_policy != "never":
+                    os.fsync(f.fileno())
+                    self.stats["fsyncs"] += 1
+            self._torn.discard(convo_id)
+            if final:
+                for convos in self._segment_convos.values():
+                    convos.discard(convo_id)
+
+        if os.fstat(self._log.fileno()).st_size >= TRANSCRIPT_LOG_SEGMENT_BYTES:
+            self._roll_log()
+        self._release_segments()
+        self.stats["batches"] += 1
+        self.stats["max_batch_size"] = max(self.stats["max_batch_size"], len(batch))
+
+    def _schedule_compress(self, convo_id: str):
+        future = asyncio.get_running_loop().run_in_executor(self._compressor, self._compress, convo_id)
+        self._compressing.add(future)
+
+        def compressed(future):
+            self._compressing.discard(future)
+            if not future.cancelled() and future.exception() is not None:
+                print(f"[{convo_id}] Failed to compress transcript: {future.exception()}")
+
+        future.add_done_callback(compressed)
+
+    def _compress(self, convo_id: str):
+        path = self.path(convo_id)
+        with open(path, "rb") as f:
+            blob, codec = compress_transcript(f.read())
+        if self.archive is not None:
+            self.archive.add(convo_id, blob, codec)
+        else:
+            tmp_path = f"{path}.{codec}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(blob)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, f"{path}.{codec}")
+        os.remove(path)
+        self.stats["compressed"] += 1
+
+    def read(self, convo_id: str) -> Optional[List[dict]]:
+        """
+        Reads a conversation's journal records from wherever they currently live: the archive,
+        a compressed file, or the live journal.
+
+        :param convo_id: Unique identifier of the conversation.
+        :type convo_id: str
+        :return: The records, or None if the conversation has no journal.
+        :rtype: Optional[List[dict]]
+        """
+        path = self.path(convo_id)
+        # The compressor may move the journal between the checks below; one retry sees where it went.
+        for _ in range(2):
+            data = self.archive.read(convo_id) if self.archive is not None else None
+            if data is not None:
+                return parse_journal(data)
+            for codec in ("zst", "gz", None):
+                candidate = f"{path}.{codec}" if codec else path
+                try:
+                    with open(candidate, "rb") as f:
+                        data = f.read()
+                except FileNotFoundError:
+                    continue
+                return parse_journal(decompress_transcript(data, codec) if codec else data)
+        return None
+
+    async def put(self, convo_id: str, convo_data: dict):
+        # Every turn is already journaled as it completes; eviction has nothing to add.
+        pass
+
+    async def get(self, convo_id: str) -> Optional[dict]:
+        records = await asyncio.to_thread(self.read, convo_id)
+        return conversation_from_journal(records) if records else None
+
+journal = TranscriptJournal(
+    TRANSCRIPT_DIR, TRANSCRIPT_FSYNC, TRANSCRIPT_FSYNC_INTERVAL_SECONDS,
+    archive=TranscriptArchive(os.path.join(TRANSCRIPT_DIR, "archive"), TRANSCRIPT_ARCHIVE_SEGMENT_BYTES)
+    if TRANSCRIPT_ARCHIVE_ENABLED else None,
+) if TRANSCRIPT_JOURNAL_ENABLED else None
+
+if conversations.cold is None and journal is not None:
+    conversations.cold = journal
+
+def render_message(msg: MessageRecord) -> str:
+    """
+    Renders one message as a line of the formatted transcript.
+    """
+    return f"{msg.sender}: {msg.content}"
+
+def complete_turn(convo_id: str, convo_data: dict, turn: int, sender: str, message: Optional[MessageRecord], content: str):
+    """
+    Stores the final content of a turn, appends it to the conversation's cached formatted
+    transcript and publishes ``turn-completed``.
+
+    :param convo_id: Unique identifier of the conversation.
+    :type convo_id: str
+    :param convo_data: The stored conversation.
+    :type convo_data: dict
+    :param turn: Zero-based turn number.
+    :type turn: int
+    :param sender: Name of the provider that produced the turn.
+    :type sender: str
+    :param message: The in-progress message created while streaming, or None if nothing streamed.
+    :type message: MessageRecord or None
+    :param content: The final text of the turn.
+    :type content: str
+    :return: None
+    """
+    if message is None:
+        message = MessageRecord(sender, content, started_at=time.time())
+        convo_data['messages'].append(message)
+    message.complete(content)
+    encoded = message.encoded(len(convo_data['messages']) - 1)
+    line = render_message(message)
+    if convo_data.get('formatted_json'):
+        line = f"\n{line}"
+    line_json = json_string_body(line)
+    convo_data['formatted_json'] = convo_data.get('formatted_json', b"") + line_json
+    conversations.grow(convo_id, len(content) + len(encoded) + len(line_json) + MESSAGE_OVERHEAD_BYTES)
+    hub.publish(convo_id, "turn-completed", {
+        "turn": turn + 1, "sender": sender, "index": len(convo_data['messages']) - 1, "content": content,
+    })
+
+async def persist_turn(convo_id: str, convo_data: dict, finished: bool = False):
+    """
+    Writes the messages completed since the last call to the transcript journal and the
+    conversation database, when they are enabled. Failures are logged and retried with the
+    next turn.
+
+    :param convo_id: Unique identifier of the conversation.
+    :type convo_id: str
+    :param convo_data: The stored conversation.
+    :type convo_data: dict
+    :param finished: Whether the conversation has ended; its status is then recorded too.
+    :type finished: bool
+    :return: None
+    """
+    if journal is not None:
+        start = convo_data.get('journaled', 0)
+        completed = [msg for msg in convo_data['messages'][start:] if not msg.in_progress]
+        records = [
+            {"type": "message", "index": index, "sender": msg.sender, "content": msg.content}
+            for index, msg in enumerate(completed, start=start)
+        ]
+        if finished:
+            records.append({"type": "finished", "messages": start + len(completed), "status": convo_data['status']})
+        try:
+            if records:
+                await journal.append(convo_id, records, final=finished)
+            convo_data['journaled'] = start + len(completed)
+        except Exception as e:
+            print(f"[{convo_id}] Failed to write conversation to journal: {e}")
+
+    if convo_db is not None:
+        start = convo_data.get('persisted', 0)
+        completed = [msg for msg in convo_data['messages'][start:] if not msg.in_progress]
+        try:
+            await convo_db.write_turn(convo_id, start, completed, convo_data['status'] if finished else None)
+            convo_data['persisted'] = start + len(completed)
+            if finished:
+                convo_data['persisted_status'] = convo_data['status']
+        except Exception as e:
+            print(f"[{convo_id}] Failed to persist turn: {e}")
+
+async def ai_conversation(convo_id: str):
     """
     Executes an AI-driven conversation for the specified conversation ID using multiple AI models in
     sequence. This function retrieves the conversation metadata, simulates dialogue turns using
     different AI models, and stores the results. The conversation, consisting of responses from
-    various models, is output to the console and optionally saved to a text file.
+    various models, is output to the console and appended turn by turn to a transcript journal.
+
+    The conversation runs as a coroutine on the event loop: provider calls and the pause between
+    turns are awaited, so a single worker can drive many conversations concurrently.
 
-    The function employs the following AI models in a repeated cycle: `gpt-4.1`, `gemini`, and
-    `deepseek`. Each model is invoked in order, and their responses are recorded. If errors
-    occur during processing (e.g., an API call fails), they are logged, and the conversation continues
-    or is gracefully terminated.
+    The function cycles through the conversation's provider rotation (by default GPT, Gemini and
+    DeepSeek) for the requested number of turns. Each provider is looked up in the registry and
+    invoked in order, and their responses are recorded. A turn whose provider has an open circuit
+    is skipped; any other error (e.g., an API call that still fails after retries) is logged and
+    recorded as the turn's message, and the conversation is terminated. The conversation ends as
+    ``finished``, ``failed`` (a turn raised) or ``cancelled`` (its task was cancelled; a partially
+    streamed turn is dropped).
 
     :param convo_id: The unique identifier for the conversation to be simulated.
                      Used to locate and store metadata and results for the ongoing dialogue.
     :type convo_id: str
     :return: None
     """
-    if convo_id not in conversations:
+    convo_data = await conversations.get(convo_id)
+    if convo_data is None:
         print(f"Error: Convo ID {convo_id} not found for background task.")
         return
 
-    convo_data = conversations[convo_id]
     start_time = time.time()
     if 'messages' not in convo_data:
         convo_data['messages'] = []
+    convo_data['status'] = STATUS_RUNNING
+    status = STATUS_FINISHED
 
     last_response = f"Let's discuss: {convo_data['topic']}"
-    model_cycle = ["GPT", "Gemini", "DeepSeek"] * 3
+    rotation = convo_data.get('rotation') or DEFAULT_ROTATION
+    turns = convo_data.get('turns', MAX_TURNS)
+    model_cycle = [rotation[i % len(rotation)] for i in range(turns)]
 
-    for turn, sender in enumerate(model_cycle):
-        try:
-            if sender == "GPT":
-                reply = call_openai(last_response)
-            elif sender == "Gemini":
-                reply = call_gemini(last_response)
-            elif sender == "DeepSeek":
-                reply = call_deepseek(last_response)
-            else:
-                reply = "(Unknown model)"
+    sender = None
+    try:
+        for turn, name in enumerate(model_cycle):
+            sender = pick_provider(exclude=sender) if name == AUTO_PROVIDER else name
+            message = None
+            published = ""
+            hub.publish(convo_id, "turn-started", {"turn": turn + 1, "sender": sender})
 
-            if not reply:
-                print(f"[{convo_id}] Warning: Empty reply from {sender}.")
-                reply = "(No response)"
+            def on_partial(text: str):
+                # The in-progress message is created on the first streamed text and updated in place.
+                nonlocal message, published
+                if message is None:
+                    message = MessageRecord(sender, text, in_progress=True, started_at=time.time())
+                    convo_data['messages'].append(message)
+                else:
+                    message.content = text
+                # A retried or hedged attempt restarts the text; clients then replace the partial turn.
+                reset = not text.startswith(published)
+                delta = text if reset else text[len(published):]
+                if delta or reset:
+                    hub.publish(convo_id, "token-delta", {"turn": turn + 1, "delta": delta, "reset": reset})
+                published = text
 
-            # Color-coded output
             try:
-                color_map = {
-                    "GPT": "\033[91m",    # Red
-                    "Gemini": "\033[94m",   # Blue
-                    "DeepSeek": "\033[95m"  # Purple
-                }
-                reset = "\033[0m"
-                color = color_map.get(sender, "")
-                print(f"\n[{convo_id}] Turn {turn + 1} | {color}{sender.upper()} replied:{reset}\n{reply}\n")
+                provider = providers.get(sender)
+                if provider is not None:
+                    reply = await provider.call(provider, last_response, on_partial)
+                else:
+                    reply = "(Unknown model)"
+
+                if not reply:
+                    print(f"[{convo_id}] Warning: Empty reply from {sender}.")
+                    reply = "(No response)"
+
+                # Color-coded output
+                try:
+                    reset = "\033[0m"
+                    color = provider.color if provider is not None else ""
+                    print(f"\n[{convo_id}] Turn {turn + 1} | {color}{sender.upper()} replied:{reset}\n{reply}\n")
+                except Exception as e:
+                    # Fallback if color print fails
+                    print(f"\n[{convo_id}] Turn {turn + 1} | {sender.upper()} replied:\n{reply}\n")
+                    print(f"(Color print error: {e})")
+
+                # Save message
+                complete_turn(convo_id, convo_data, turn, sender, message, reply)
+                await persist_turn(convo_id, convo_data)
+                last_response = reply
+
+            except CircuitOpenError:
+                # Fail fast: no message is stored for a provider that is known to be down.
+                print(f"[{convo_id}] Skipping turn {turn + 1}: {sender} circuit is open.")
+                if message is not None:
+                    convo_data['messages'].remove(message)
+                hub.publish(convo_id, "turn-skipped", {"turn": turn + 1, "sender": sender})
             except Exception as e:
-                # Fallback if color print fails
-                print(f"\n[{convo_id}] Turn {turn + 1} | {sender.upper()} replied:\n{reply}\n")
-                print(f"(Color print error: {e})")
+                print(f"[{convo_id}] Error during turn {turn+1} ({sender}): {e}")
+                complete_turn(convo_id, convo_data, turn, sender, message, f"Error during generation: {e}")
+                status = STATUS_FAILED
+                break
+    except asyncio.CancelledError:
+        status = STATUS_CANCELLED
+        if convo_data['messages'] and convo_data['messages'][-1].in_progress:
+            convo_data['messages'].pop()
+        raise
+    finally:
+        await end_conversation(convo_id, convo_data, status)
 
-            # Save message
-            convo_data['messages'].append(Message(sender=sender, content=reply).dict())
-            last_response = reply
+    print(f"[{convo_id}] Conversation {status}. Turns: {len(model_cycle)}. Time: {time.time() - start_time:.2f}s")
 
-        except Exception as e:
-            print(f"[{convo_id}] Error during turn {turn+1} ({sender}): {e}")
-            convo_data['messages'].append(Message(sender=sender, content=f"Error during generation: {e}").dict())
-            break
+async def end_conversation(convo_id: str, convo_data: dict, status: str):
+    """
+    Records the terminal status of a conversation, publishes ``conversation-finished``, closes its
+    event channel and persists whatever has not been written yet.
 
-        time.sleep(8)
+    :param convo_id: Unique identifier of the conversation.
+    :type convo_id: str
+    :param convo_data: The stored conversation.
+    :type convo_data: dict
+    :param status: One of ``TERMINAL_STATUSES``.
+    :type status: str
+    :return: None
+    """
+    convo_data['status'] = status
+    hub.publish(convo_id, "conversation-finished", {"messages": len(convo_data['messages']), "status": status})
+    channel = hub.close(convo_id)
+    if channel is not None:
+        # The compacted channel lives as long as the conversation does, so it counts toward the store.
+        conversations.grow(convo_id, channel.nbytes)
+    await persist_turn(convo_id, convo_data, finished=True)
 
-    print(f"[{convo_id}] Conversation finished. Turns: {len(model_cycle)}. Time: {time.time() - start_time:.2f}s")
+async def stop_conversation(convo_id: str):
+    """
+    Cancels a conversation's task and waits until it has recorded its ``cancelled`` status.
 
-    # Write conversation to file
-    try:
-        with open(f"{convo_id}.txt", "w") as f:
-            f.write(f"Topic: {convo_data['topic']}\n\n")
-            for msg in convo_data['messages']:
-                f.write(f"{msg['sender'].upper()}: {msg['content']}\n\n")
-    except Exception as e:
-        print(f"[{convo_id}] Failed to write conversation to file: {e}")
+    :param convo_id: Unique identifier of the conversation.
+    :type convo_id: str
+    :return: None
+    """
+    task = conversation_tasks.get(convo_id)
+    if task is None:
+        return
+    task.cancel()
+    await asyncio.wait([task])
+    convo_data = await conversations.get(convo_id)
+    if convo_data is not None and convo_data.get('status') == STATUS_QUEUED:
+        # Cancelled before its task first ran, so ai_conversation never recorded the outcome.
+        await end_conversation(convo_id, convo_data, STATUS_CANCELLED)
 
 @app.post("/start-convo", response_model=ConversationLog)
-def start_conversation(req: StartConversationRequest, bg: BackgroundTasks):
+async def start_conversation(req: StartConversationRequest):
     """
     Starts a new conversation and schedules an AI task to handle messages for the conversation.
 
     A new conversation ID is generated and associated with the topic provided in
-    the input request. The conversation is stored in the `conversations` dictionary with an
-    empty list of messages. An asynchronous task is also initiated to handle this new
-    conversation.
+    the input request. The conversation is stored in the `conversations` store with an
+    empty list of messages, its provider rotation and its turn count. The conversation itself
+    is started as an asyncio task on the running event loop, so it does not occupy a
+    threadpool worker.
 
     :param req: Input request to start a new conversation, containing the topic for the
-                conversation.
+                conversation and optionally the provider rotation and number of turns.
                 Type: StartConversationRequest
-    :param bg: Background tasks instance used to schedule the AI conversation handler task.
-               Type: BackgroundTasks
+    :raises HTTPException: 400 if the rotation names an unregistered provider.
     :return: A `ConversationLog` instance that holds the newly created conversation's ID,
-             topic, and an empty messages list.
+             topic, an empty messages list and the ``queued`` status.
              Type: ConversationLog
     """
+    rotation = req.rotation or DEFAULT_ROTATION
+    unknown = [name for name in rotation if name != AUTO_PROVIDER and name not in providers]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown providers: {', '.join(unknown)}")
+
     convo_id = str(uuid.uuid4())
-    conversations[convo_id] = {
+    convo_data = {
         "topic": req.topic,
-        "messages": []
+        "messages": [],
+        "rotation": rotation,
+        "turns": req.turns,
+        "status": STATUS_QUEUED,
+        # JSON-escaped transcript of the completed messages, extended as each turn completes so
+        # reads never re-encode the history.
+        "formatted_json": b"",
     }
+    conversations.create(convo_id, convo_data)
+    hub.open(convo_id)
+    if journal is not None:
+        try:
+            await journal.append(convo_id, [{"type": "conversation", "convo_id": convo_id, "topic": req.topic, "created_at": time.time()}])
+        except Exception as e:
+            print(f"[{convo_id}] Failed to write conversation to journal: {e}")
+    if convo_db is not None:
+        try:
+            await convo_db.create(convo_id, convo_data)
+        except Exception as e:
+            print(f"[{convo_id}] Failed to persist conversation: {e}")
     print(f"Received request to start convo {convo_id} on topic: {req.topic}")
-    bg.add_task(ai_conversation, convo_id)
+    task = asyncio.create_task(ai_conversation(convo_id))
+    conversation_tasks[convo_id] = task
+    task.add_done_callback(lambda _: conversation_tasks.pop(convo_id, None))
     return ConversationLog(
         convo_id=convo_id,
         topic=req.topic,
-        messages=[]
+        messages=[],
+        status=STATUS_QUEUED,
     )
 
+@app.post("/cancel-convo/{convo_id}")
+async def cancel_conversation(convo_id: str):
+    """
+    Cancels a queued or running conversation. The turn in flight is abandoned, completed turns
+    are kept, and the conversation ends with status ``cancelled``. Cancelling a conversation
+    that has already ended changes nothing.
+
+    :param convo_id: Unique identifier of the conversation to cancel.
+    :type convo_id: str
+    :raises HTTPException: 404 if the conversation does not exist.
+    :return: The conversation's ID and resulting status.
+    :rtype: dict
+    """
+    convo_data = await conversations.get(convo_id)
+    if convo_data is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    if convo_data.get("status") not in TERMINAL_STATUSES:
+        await stop_conversation(convo_id)
+    return {"convo_id": convo_id, "status": convo_data.get("status")}
+
+@app.get("/providers")
+def list_providers():
+    """
+    Lists the registered providers that can be used in a conversation rotation.
+
+    :return: A dictionary with the provider names and their models.
+    :rtype: dict
+    """
+    return {
+        "providers": [{"name": p.name, "model": p.model} for p in providers.values()],
+        "default_rotation": DEFAULT_ROTATION,
+    }
+
+# ==== RESPONSE COMPRESSION ====
+# Conversation logs are compressed with the best encoding the client accepts (brotli or zstd when
+# their packages are installed, otherwise gzip) once they reach COMPRESSION_MIN_BYTES. Streaming
+# endpoints are never compressed, since that would buffer their events.
+COMPRESSION_ENABLED = os.environ.get("COMPRESSION_ENABLED", "1") == "1"
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get("COMPRESSION_BROTLI_QUALITY", "5"))
+COMPRESSION_ZSTD_LEVEL = int(os.environ.get("COMPRESSION_ZSTD_LEVEL", "3"))
+COMPRESSION_COLD_CACHE_BYTES = int(os.environ.get("COMPRESSION_COLD_CACHE_BYTES", str(16 * 1024 * 1024)))
+
+# Content codings in order of preference, used to break ties between equal q-values.
+RESPONSE_ENCODERS = {}
+if BROTLI_AVAILABLE:
+    RESPONSE_ENCODERS["br"] = lambda body: brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY)
+if ZSTD_AVAILABLE:
+    RESPONSE_ENCODERS["zstd"] = lambda body: zstandard.ZstdCompressor(level=COMPRESSION_ZSTD_LEVEL).compress(body)
+# mtime=0 keeps the gzip header, and so the body served under a strong ETag, byte-for-byte stable.
+RESPONSE_ENCODERS["gzip"] = lambda body: gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL, mtime=0)
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Picks the content coding for a response from the request's ``Accept-Encoding`` header.
+
+    :param accept_encoding: The raw header value, if any.
+    :type accept_encoding: str or None
+    :return: A key of ``RESPONSE_ENCODERS``, or None to send the response uncompressed.
+    :rtype: str or None
+    """
+    if not COMPRESSION_ENABLED or not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        match = re.search(r"q\s*=\s*([0-9.]+)", params)
+        try:
+            weights[coding.strip().lower()] = float(match.group(1)) if match else 1.0
+        except ValueError:
+            continue
+    best, best_weight = None, 0.0
+    for coding in RESPONSE_ENCODERS:
+        weight = weights.get(coding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+class CompressedBodyCache:
+    """
+    Bounded LRU of compressed ``/convo-log`` bodies of conversations that are no longer held in
+    memory, keyed by conversation and coding. In-memory conversations keep their compressed
+    bodies with them; evicted ones are rebuilt from the cold tier on every read, so without this
+    each read would re-read, re-parse and recompress the transcript. Entries hold the ETag too,
+    so a hit (or a 304) is answered without touching the cold tier.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+
+    def get(self, convo_id: str, encoding: str) -> Optional[Tuple[str, bytes]]:
+        """
+        Returns the cached ETag and compressed body, marking them recently used, or None.
+        """
+        entry = self._entries.get((convo_id, encoding))
+        if entry is not None:
+            self._entries.move_to_end((convo_id, encoding))
+        return entry
+
+    def put(self, convo_id: str, encoding: str, etag: str, body: bytes):
+        """
+        Caches a compressed body and drops the least recently used ones beyond ``max_bytes``.
+        """
+        if len(body) > self.max_bytes:
+            return
+        previous = self._entries.pop((convo_id, encoding), None)
+        if previous is not None:
+            self.total_bytes -= len(previous[1])
+        self._entries[(convo_id, encoding)] = (etag, body)
+        self.total_bytes += len(body)
+        while self.total_bytes > self.max_bytes:
+            _, (_, dropped) = self._entries.popitem(last=False)
+            self.total_bytes -= len(dropped)
+
+cold_bodies = CompressedBodyCache(COMPRESSION_COLD_CACHE_BYTES)
+
+def json_response(convo_id: str, body: bytes, headers: dict, encoding: Optional[str],
+                  cache: Optional[dict] = None) -> Response:
+    """
+    Sends a JSON body, compressed with ``encoding`` when it is large enough. Compressed
+    responses get the ETag suffixed with the coding, so every representation has its own strong
+    ETag (see :func:`matching_etag`).
+
+    :param convo_id: Unique identifier of the conversation, to account cached bytes to it.
+    :type convo_id: str
+    :param body: The encoded JSON body; may be empty when ``cache`` already holds it compressed.
+    :type body: bytes
+    :param headers: Response headers, including the ETag.
+    :type headers: dict
+    :param encoding: The negotiated content coding, or None.
+    :type encoding: str or None
+    :param cache: Where to keep compressed bodies by coding; only given for ended conversations,
+        whose body never changes.
+    :type cache: dict or None
+    :return: The response.
+    :rtype: Response
+    """
+    if encoding is None:
+        return Response(body, media_type="application/json", headers=headers)
+    compressed = cache.get(encoding) if cache is not None else None
+    if compressed is None and len(body) >= COMPRESSION_MIN_BYTES:
+        compressed = RESPONSE_ENCODERS[encoding](body)
+        if cache is not None:
+            cache[encoding] = compressed
+            conversations.grow(convo_id, len(compressed))
+    if compressed is not None:
+        headers = dict(headers, **{"Content-Encoding": encoding, "ETag": encoded_etag(headers["ETag"], encoding)})
+        body = compressed
+    return Response(body, media_type="application/json", headers=headers)
+
+def formatted_transcript_json(convo_data: dict) -> bytes:
+    """
+    Returns the formatted transcript of a conversation as a JSON string literal. Completed turns
+    are rendered and escaped once, as they complete, into a cached fragment; only a turn that is
+    still streaming is encoded here.
+
+    :param convo_data: The stored conversation.
+    :type convo_data: dict
+    :return: One ``sender: content`` line per message, JSON-encoded.
+    :rtype: bytes
+    """
+    body = convo_data.get("formatted_json", b"")
+    messages = convo_data.get("messages", [])
+    if messages and messages[-1].in_progress:
+        line = render_message(messages[-1])
+        body += json_string_body(f"\n{line}" if body else line)
+    return b'"' + body + b'"'
+
+def convo_etag(convo_id: str, convo_data: dict) -> str:
+    """
+    Builds the ETag of a conversation log. While the conversation runs, it combines the message
+    count, the sequence number of the latest live event (which also changes while a turn streams
+    in) and the status. Once the conversation has ended its log never changes, so the ETag is
+    just the message count and terminal status, and stays the same after the conversation is
+    evicted or the server restarts.
+
+    :param convo_id: Unique identifier of the conversation.
+    :type convo_id: str
+    :param convo_data: The stored conversation.
+    :type convo_data: dict
+    :return: A quoted, strong ETag value.
+    :rtype: str
+    """
+    status = convo_data.get("status", STATUS_QUEUED)
+    count = len(convo_data.get("messages", []))
+    if status in TERMINAL_STATUSES:
+        return f'"{count}-{status}"'
+    channel = hub.get(convo_id)
+    seq = channel.last_seq if channel is not None else 0
+    return f'"{count}-{seq}-{status}"'
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """
+    Returns the ETag of a representation compressed with ``encoding``.
+    """
+    return f'{etag[:-1]}-{encoding}"'
+
+def matching_etag(if_none_match: Optional[str], etag: str) -> Optional[str]:
+    """
+    Checks an ``If-None-Match`` header against an ETag and its compressed variants, using weak
+    comparison.
+
+    :param if_none_match: The raw header value, if any.
+    :type if_none_match: str or None
+    :param etag: The current ETag.
+    :type etag: str
+    :return: The tag the client's cached copy is current under, or None.
+    :rtype: str or None
+    """
+    if not if_none_match:
+        return None
+    variants = {etag, *(encoded_etag(etag, encoding) for encoding in RESPONSE_ENCODERS)}
+    for tag in (tag.strip() for tag in if_none_match.split(",")):
+        if tag == "*":
+            return etag
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag in variants:
+            return tag
+    return None
+
+def log_headers(etag: str, ended: bool) -> dict:
+    """
+    Returns the caching headers of a conversation log: ended conversations never change, so
+    their logs are immutable.
+    """
+    return {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={ENDED_CONVO_MAX_AGE_SECONDS}, immutable" if ended else "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+
+async def wait_for_turn(convo_id: str, convo_data: dict, timeout: float):
+    """
+    Holds a long-poll until a turn starts, completes or is skipped, the conversation finishes, or
+    ``timeout`` seconds pass. Streamed token deltas alone do not end the wait.
+
+    :param convo_id: Unique identifier of the conversation.
+    :type convo_id: str
+    :param convo_data: The stored conversation.
+    :type convo_data: dict
+    :param timeout: Maximum seconds to wait.
+    :type timeout: float
+    :return: None
+    """
+    channel = hub.get(convo_id)
+    if channel is None:
+        return
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    cursor = channel.last_seq
+    while not channel.closed and convo_data.get("status") not in TERMINAL_STATUSES:
+        remaining = deadline - loop.time()
+        if remaining <= 0 or not await channel.wait(cursor, remaining):
+            return
+        if any(event != "token-delta" for _, event, _ in channel.read(cursor)):
+            return
+        cursor = channel.last_seq
+
+@app.get("/journal-stats")
+def get_journal_stats():
+    """
+    Reports the transcript writer's batching and backpressure counters.
+
+    :return: The counters and the current queue depth, or ``{"enabled": False}``.
+    :rtype: dict
+    """
+    if journal is None:
+        return {"enabled": False}
+    depth = journal._queue.qsize() if journal._queue is not None else 0
+    return {"enabled": True, "queue_depth": depth, **journal.stats}
+
 @app.get("/convo-log/{convo_id}")
-def get_convo_log(convo_id: str):
+async def get_convo_log(
+    convo_id: str,
+    request: Request,
+    wait: float = Query(0, ge=0, le=CONVO_LOG_MAX_WAIT_SECONDS),
+    since: Optional[int] = Query(None, ge=0),
+):
     """
     Retrieves a conversation log based on the specified conversation ID. If the
     conversation ID does not exist in the available data, a default response is
     returned with minimal placeholder values. Otherwise, the function assembles
     and formats the conversation's topic and messages.
 
+    Responses carry the conversation's ``status`` (queued, running, finished, failed or
+    cancelled) and an ETag. A client that sends the ETag back in ``If-None-Match`` gets an
+    empty 304 response while nothing has changed; with ``wait`` set, the request is held for up
+    to that many seconds until a new turn arrives before answering. Once the conversation has
+    ended, responses are marked ``immutable`` and may be cached for
+    ``ENDED_CONVO_MAX_AGE_SECONDS``.
+
+    With ``since`` set, only the messages from that index on are returned, as structured
+    messages, together with a ``next`` cursor to pass as ``since`` on the following request.
+    A turn that is still streaming is included but not counted in ``next``, so it is fetched
+    again until it completes.
+
     :param convo_id: Unique identifier for the conversation to retrieve
     :type convo_id: str
-    :return: Either a dictionary containing the ID, topic, and formatted conversation
-        log, or a default conversation object with placeholder values if the ID
-        does not exist.
-    :rtype: dict or ConversationLog
+    :param request: The incoming request, used to read the ``If-None-Match`` header.
+    :type request: Request
+    :param wait: Seconds to wait for a new turn when the client's copy is current.
+    :type wait: float
+    :param since: Index of the first message to return; enables the incremental form.
+    :type since: int or None
+    :return: Either a response containing the ID, topic, and formatted conversation
+        log (or the messages after ``since``), a 304 response, or a default conversation
+        object with placeholder values if the ID does not exist.
+    :rtype: Response or ConversationLog
     """
-    if convo_id not in conversations:
+    if_none_match = request.headers.get("if-none-match")
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    cold_cached = None
+    if since is None and encoding is not None and convo_id not in conversations:
+        cold_cached = cold_bodies.get(convo_id, encoding)
+
+    if cold_cached is not None:
+        # Only ended conversations leave memory, so the cached body is still current.
+        etag, compressed = cold_cached
+        headers = log_headers(etag, ended=True)
+        cached_tag = matching_etag(if_none_match, etag)
+        if cached_tag:
+            return Response(status_code=304, headers=dict(headers, ETag=cached_tag))
+        return json_response(convo_id, b"", headers, encoding, {encoding: compressed})
+
+    convo_data = await conversations.get(convo_id)
+    if convo_data is None:
         return ConversationLog(convo_id=convo_id, topic="Not Found", messages=[])
 
-    convo_data = conversations[convo_id]
-    return {
-        "convo_id": convo_id,
-        "topic": convo_data.get("topic", "Unknown Topic"),
-        "formatted": "\n".join(
-            f"{msg['sender']}: {msg['content']}" for msg in convo_data.get("messages", [])
+    etag = convo_etag(convo_id, convo_data)
+    if matching_etag(if_none_match, etag) and wait > 0:
+        await wait_for_turn(convo_id, convo_data, wait)
+        etag = convo_etag(convo_id, convo_data)
+    status = convo_data.get("status", STATUS_QUEUED)
+    ended = status in TERMINAL_STATUSES
+    headers = log_headers(etag, ended)
+    cached_tag = matching_etag(if_none_match, etag)
+    if cached_tag:
+        return Response(status_code=304, headers=dict(headers, ETag=cached_tag))
+
+    messages = convo_data.get("messages", [])
+    if since is not None:
+        complete = len(messages) - 1 if messages and messages[-1].in_progress else len(messages)
+        fragments = b",".join(msg.encoded(index) for index, msg in enumerate(messages[since:], start=since))
+        body = (
+            b'{"convo_id":' + dump_json(convo_id)
+            + b',"topic":' + dump_json(convo_data.get("topic", "Unknown Topic"))
+            + b',"messages":[' + fragments
+            + b'],"next":' + str(max(since, complete)).encode()
+            + b',"finished":' + (b"true" if ended else b"false")
+            + b',"status":' + dump_json(status) + b"}"
         )
-    }
+        return json_response(convo_id, body, headers, encoding)
+
+    # The transcript of an ended conversation never changes, so its compressed forms are kept with
+    # it, or in cold_bodies once it has left memory.
+    cache = convo_data.setdefault("compressed", {}) if ended else None
+    if cache is not None and encoding in cache:
+        return json_response(convo_id, b"", headers, encoding, cache)
+    body = (
+        b'{"convo_id":' + dump_json(convo_id)
+        + b',"topic":' + dump_json(convo_data.get("topic", "Unknown Topic"))
+        + b',"formatted":' + formatted_transcript_json(convo_data)
+        + b',"status":' + dump_json(status) + b"}"
+    )
+    response = json_response(convo_id, body, headers, encoding, cache)
+    if cache is not None and encoding in cache and convo_id not in conversations:
+        cold_bodies.put(convo_id, encoding, etag, cache[encoding])
+    return response
+
+@app.get("/convo-stream/{convo_id}")
+async def stream_convo(convo_id: str, request: Request):
+    """
+    Streams a conversation's live events as Server-Sent Events: ``turn-started``,
+    ``token-delta`` (new text of the turn being generated; ``reset`` means the text restarted),
+    ``turn-completed``, ``turn-skipped`` and finally ``conversation-finished``, after which the
+    stream ends. Every event carries an ``id``; a reconnecting client sends it back in the
+    ``Last-Event-ID`` header and only receives the events it missed. If those events have
+    already left the conversation's buffer, an ``events-lost`` event is sent first and the client
+    should refetch ``/convo-log``. Only conversations held in memory can be streamed; once a
+    conversation has been evicted its log is still available from ``/convo-log``.
+
+    :param convo_id: Unique identifier for the conversation to stream
+    :type convo_id: str
+    :param request: The incoming request, used to read the ``Last-Event-ID`` header.
+    :type request: Request
+    :raises HTTPException: 404 if the conversation does not exist.
+    :return: A ``text/event-stream`` response.
+    :rtype: StreamingResponse
+    """
+    events = hub.get(convo_id)
+    if events is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    try:
+        last_event_id = int(request.headers.get("last-event-id", "0"))
+    except ValueError:
+        last_event_id = 0
+
+    async def event_source():
+        cursor = last_event_id
+        while True:
+            for seq, event, data in events.read(cursor):
+                yield f"id: {seq}\nevent: {event}\ndata: {data}\n\n"
+                cursor = seq
+            if events.closed:
+                return
+            if not await events.wait(cursor, SSE_KEEPALIVE_SECONDS):
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def ws_frame(convo_id: str, seq: int, event: str, data: str) -> str:
+    """
+    Builds a WebSocket frame for a conversation event. ``data`` is already-encoded JSON and is
+    embedded as-is.
+    """
+    return f'{{"convo_id": {json.dumps(convo_id)}, "id": {seq}, "event": {json.dumps(event)}, "data": {data}}}'
+
+class WebSocketSubscriber:
+    """
+    One WebSocket connection with any number of conversation subscriptions. Events from every
+    subscription are funnelled into a single bounded send buffer drained by one sender task, so a
+    slow client can only ever hold ``WS_SEND_BUFFER`` frames in memory.
+    """
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.queue = asyncio.Queue(maxsize=WS_SEND_BUFFER)
+        self.subscriptions = {}
+        self.closing = None
+
+    async def enqueue(self, convo_id: str, event: str, frame: str) -> bool:
+        """
+        Queues a frame, applying the slow-consumer policy when the send buffer is full. Under the
+        "drop" policy only ``token-delta`` frames are discarded (the rest of that turn's deltas
+        are skipped too, since ``turn-completed`` carries the full text); other frames wait for
+        room, which only holds back this client's subscription.
+
+        :return: False if the client is being disconnected.
+        :rtype: bool
+        """
+        if self.closing is not None:
+            return False
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            pass
+        if WS_SLOW_CONSUMER_POLICY == "disconnect":
+            self.closing = asyncio.create_task(self.websocket.close(code=1008, reason="Slow consumer"))
+            return False
+        if event == "token-delta":
+            return True
+        await self.queue.put(frame)
+        return True
+
+    async def follow(self, convo_id: str, events: EventChannel, after: int):
+        cursor = after
+        skipping_turn = None
+        while True:
+            for seq, event, data in events.read(cursor):
+                cursor = seq
+                if event == "token-delta":
+                    turn = json.loads(data)["turn"]
+                    if turn == skipping_turn:
+                        continue
+                    if self.queue.full() and WS_SLOW_CONSUMER_POLICY == "drop":
+                        skipping_turn = turn
+                        continue
+                if not await self.enqueue(convo_id, event, ws_frame(convo_id, seq, event, data)):
+                    return
+            if events.closed:
+                break
+            await events.wait(cursor, SSE_KEEPALIVE_SECONDS)
+        self.subscriptions.pop(convo_id, None)
+
+    async def error(self, convo_id: str, detail: str):
+        await self.enqueue(convo_id, "error", json.dumps({"convo_id": convo_id, "event": "error", "data": {"detail": detail}}))
+
+    async def subscribe(self, convo_id: str, after: int = 0):
+        events = hub.get(convo_id)
+        if events is None:
+            await self.error(convo_id, "Conversation not found")
+        elif len(self.subscriptions) >= WS_MAX_SUBSCRIPTIONS:
+            await self.error(convo_id, "Too many subscriptions")
+        elif convo_id not in self.subscriptions:
+            self.subscriptions[convo_id] = asyncio.create_task(self.follow(convo_id, events, after))
+
+    def unsubscribe(self, convo_id: str):
+        task = self.subscriptions.pop(convo_id, None)
+        if task is not None:
+            task.cancel()
+
+    async def send_loop(self):
+        while True:
+            await self.websocket.send_text(await self.queue.get())
+
+    def close(self):
+        for convo_id in list(self.subscriptions):
+            self.unsubscribe(convo_id)
+
+def parse_ws_request(text) -> object:
+    """
+    Parses and validates one client frame of ``/convo-ws``.
+
+    :param text: The frame payload.
+    :type text: str or bytes
+    :return: The request object, with ``last_event_id`` normalized to an int, or a string
+        describing why the frame was rejected.
+    :rtype: dict or str
+    """
+    try:
+        request = json.loads(text)
+    except ValueError:
+        return "Invalid JSON"
+    if not isinstance(request, dict):
+        return "Expected a JSON object"
+    last_event_id = request.get("last_event_id", 0)
+    try:
+        request["last_event_id"] = max(0, int(last_event_id))
+    except (TypeError, ValueError):
+        return f"Invalid last_event_id: {last_event_id!r}"
+    return request
+
+@app.websocket("/convo-ws")
+async def convo_websocket(websocket: WebSocket):
+    """
+    Multiplexes live events for many conversations over one WebSocket. The client sends
+    ``{"action": "subscribe", "convo_id": ..., "last_event_id": 0}`` or
+    ``{"action": "unsubscribe", "convo_id": ...}``; the server sends one JSON frame per event,
+    ``{"convo_id", "id", "event", "data"}``, using the same events as ``/convo-stream``. As with
+    ``/convo-stream``, evicted conversations cannot be subscribed to.
+    When the client cannot keep up, ``WS_SLOW_CONSUMER_POLICY`` decides whether streamed
+    ``token-delta`` frames are dropped or the connection is closed.
+
+    :param websocket: The client connection.
+    :type websocket: WebSocket
+    """
+    await websocket.accept()
+    subscriber = WebSocketSubscriber(websocket)
+    sender = asyncio.create_task(subscriber.send_loop())
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            request = parse_ws_request(message.get("text") or message.get("bytes") or "")
+            if isinstance(request, str):
+                # A bad frame only earns an error reply; the other subscriptions carry on.
+                await subscriber.error("", request)
+                continue
+            action = request.get("action")
+            convo_id = str(request.get("convo_id", ""))
+            if action == "subscribe":
+                await subscriber.subscribe(convo_id, request["last_event_id"])
+            elif action == "unsubscribe":
+                subscriber.unsubscribe(convo_id)
+            else:
+                await subscriber.error(convo_id, f"Unknown action: {action}")
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        subscriber.close()
+        sender.cancel()